@@ -1,4 +1,12 @@
+local json = require("dkjson")
+
 local jsonName = "alliesHealthBars.json"
+local jsonTempName = jsonName .. ".tmp"
+
+-- Every snapshot is stamped with the session (time the script has been loaded at) and an increasing sequence number
+-- so the server can skip snapshots it has already seen and detect missed ones
+local snapshotSession = os.time()
+local snapshotSequence = 0
 
 local playersData = {}
 local disconnectedPlayers = {}
@@ -6,18 +14,54 @@ local disconnectedPlayers = {}
 local updatePlayerAlliesDataTimer = nil
 
 local writeplayersData = function()
-	jsonInterface.quicksave(jsonName, playersData)
+	snapshotSequence = snapshotSequence + 1
+	
+	local dataPath = tes3mp.GetDataPath() .. "/"
+	local jsonPath = dataPath .. jsonName
+	local jsonTempPath = dataPath .. jsonTempName
+	
+	-- Header goes first so the server can tell an already seen snapshot without parsing the rest
+	local content = '{"sequence":' .. snapshotSequence .. ',"session":' .. snapshotSession ..
+		',"timestamp":' .. os.time() .. ',"players":' .. json.encode(playersData) .. '}'
+	
+	local file = io.open(jsonTempPath, "w")
+	if file == nil then return end
+	file:write(content)
+	file:close()
+	
+	-- Replace the snapshot in a single step so the server never reads a partially written file
+	if not os.rename(jsonTempPath, jsonPath) then
+		-- Windows does not allow renaming over an existing file
+		os.remove(jsonPath)
+		os.rename(jsonTempPath, jsonPath)
+	end
 end
 
+-- Lowercased account name -> pid of authenticated players
+local pidsByName = {}
+
 local getPidByName = function(name)
+	return pidsByName[string.lower(name)]
+end
 
-	for pid, player in pairs(Players) do
-		if string.lower(name) == string.lower(player.accountName) then
-			return pid
-		end
+-- Read player's stats once per tick and reuse them for every player having them as an ally
+local getPlayerStats = function(pid, statsByPid)
+	local stats = statsByPid[pid]
+	
+	if stats == nil then
+		stats = {
+			level = tes3mp.GetLevel(pid), 
+			baseHealth = tes3mp.GetHealthBase(pid), 
+			currentHealth = tes3mp.GetHealthCurrent(pid),
+			baseMagicka = tes3mp.GetMagickaBase(pid),
+			currentMagicka = tes3mp.GetMagickaCurrent(pid),
+			baseFatigue = tes3mp.GetFatigueBase(pid),
+			currentFatigue = tes3mp.GetFatigueCurrent(pid)
+			}
+		statsByPid[pid] = stats
 	end
 	
-	return nil
+	return stats
 end
 
 -- Resolve entries for players who are no longer in alliance
@@ -62,6 +106,8 @@ customEventHooks.registerHandler("OnServerPostInit", function(eventStatus)
 end)
 
 customEventHooks.registerHandler("OnPlayerAuthentified", function(eventStatus, pid)
+	pidsByName[string.lower(Players[pid].accountName)] = pid
+	
 	-- Do not start timer if there are less than 2 players
 	if tableHelper.getCount(Players) < 2 then return end
 	
@@ -74,6 +120,10 @@ end)
 customEventHooks.registerValidator("OnPlayerDisconnect", function(eventStatus, pid)
 	local playerName = Players[pid].accountName
 	table.insert(disconnectedPlayers, playerName)
+	
+	if pidsByName[string.lower(playerName)] == pid then
+		pidsByName[string.lower(playerName)] = nil
+	end
 end)
 
 updatePlayerAlliesData = function()
@@ -87,6 +137,9 @@ updatePlayerAlliesData = function()
 	
 	processDisconnectedPlayers()
 	
+	-- Stats of every player are read at most once per tick
+	local statsByPid = {}
+	
 	-- update allies health table for every logged player
 	for pid, player in pairs(Players) do
 		local playerName = player.accountName
@@ -101,16 +154,8 @@ updatePlayerAlliesData = function()
 		for _, allyPlayerName in ipairs(alliedPlayers) do
 			local alliedPid = getPidByName(allyPlayerName)
 			
-			if Players[alliedPid] ~= nil and Players[alliedPid]:IsLoggedIn() then				
-				alliesData[allyPlayerName] = {
-					level = tes3mp.GetLevel(alliedPid), 
-					baseHealth = tes3mp.GetHealthBase(alliedPid), 
-					currentHealth = tes3mp.GetHealthCurrent(alliedPid),
-					baseMagicka = tes3mp.GetMagickaBase(alliedPid),
-					currentMagicka = tes3mp.GetMagickaCurrent(alliedPid),
-					baseFatigue = tes3mp.GetFatigueBase(alliedPid),
-					currentFatigue = tes3mp.GetFatigueCurrent(alliedPid)
-					}
+			if alliedPid ~= nil and Players[alliedPid] ~= nil and Players[alliedPid]:IsLoggedIn() then				
+				alliesData[allyPlayerName] = getPlayerStats(alliedPid, statsByPid)
 			end
 		end
 	end
@@ -1,20 +1,34 @@
 import json
 import sys
+import time
+from tkinter import Tk
 
 from PodSixNet.Connection import ConnectionListener, connection
 
-from logger import Logger
+from logger import Logger, ERROR, WARNING
 from overlay import Overlay
+from stats_codec import WIRE_FORMATS, unpack_allies
 
 """All methods starting with capital letter are network related"""
 
 class Client(ConnectionListener):
     def __init__(self):
+        started_at = time.perf_counter()
+
         # Create logger
         self._logger = Logger("client")
 
         # Obtain config
         self.config = self._get_config()
+        self._logger.configure(self.config.get("log", {}))
+
+        # Tk root exists from the start so that networking runs within Tk's event loop
+        # It stays hidden until the overlay is created
+        self.root = Tk()
+        self.root.withdraw()
+
+        # Milliseconds between two network pumps
+        self._pump_interval = self.config.get("pump_interval_ms", 20)
 
         # Get ip and port
         address = self.config["destination_address"]
@@ -28,7 +42,10 @@ class Client(ConnectionListener):
         self.additional_stats_settings = {'magicka_enabled': self.config['magicka_enabled'],
                                           'fatigue_enabled': self.config['fatigue_enabled']}
 
-        self._logger.append("Client launched")
+        # Ally id -> ally name, used to decode allies data in binary format
+        self._ally_names = dict()
+
+        self._logger.append("Client launched in " + self._format_duration(started_at))
 
     """Network related functions"""
 
@@ -44,12 +61,26 @@ class Client(ConnectionListener):
         self.Send_player_name()
 
     # Log received allies data
-    # Save the data and update overlay
+    # Save the data into overlay, it redraws the frames on its next render pass
     def Network_receive_allies_data(self, data):
-        self._logger.append("Received new allies data")
+        self._logger.append("Received new allies data", key="allies_data_received")
         player_data = data["allies_data"]
         self.overlay.update_frames(player_data)
 
+    # Apply changed allies (only changed fields of known allies) and remove allies no longer present
+    def Network_receive_allies_delta(self, data):
+        self._logger.append("Received allies data update", key="allies_data_received")
+        self.overlay.patch_frames(data["changed"], data["removed"])
+
+    # Decode allies data received in binary format and apply it the same way as a delta
+    def Network_receive_allies_packed(self, data):
+        self._logger.append("Received allies data update", key="allies_data_received")
+        self._ally_names.update(data["names"])
+
+        changed = {self._ally_names[ally_id]: stats for ally_id, stats in unpack_allies(data["records"]).items()}
+        removed = [self._ally_names[ally_id] for ally_id in data["removed"]]
+        self.overlay.patch_frames(changed, removed)
+
     # Log receival of server's additional stats settings
     # Compare them with client's preferences and create Overlay instance with preferred settings (if available)
     def Network_receive_server_stats_settings(self, data):
@@ -63,22 +94,38 @@ class Client(ConnectionListener):
         self._logger.append("Received server stats settings (magicka and fatigue)")
 
         # Finally create overlay instance as the additional settings have been received
-        self.overlay = Overlay(magicka_enabled, fatigue_enabled)
+        started_at = time.perf_counter()
+        self.overlay = Overlay(self.root, magicka_enabled, fatigue_enabled, self.config.get("max_fps", 30))
+        self._logger.append("Overlay created in " + self._format_duration(started_at) +
+                            (" (cached layout" if self.overlay.layout_cached else " (layout built") +
+                            (", font registered)" if self.overlay.font_registered else ")"))
 
     # Log disconnected event
     # Close the client
     def Network_disconnected(self, data):
         if 'message' in data:
-            self._logger.append("You have been disconnected " + data['message'])
+            self._logger.append("You have been disconnected " + data['message'], WARNING)
         else:
             self._logger.append("You have been disconnected")
         sys.exit()
 
     # Pass the client's name to the server
     def Send_player_name(self):
-        self.Send({"action": "receive_player_name", "player_name": self._get_player_name(), "ip": "127.0.0.1"})
+        self.Send({"action": "receive_player_name", "player_name": self._get_player_name(), "ip": "127.0.0.1",
+                   "delta_updates": True, "wire_formats": list(WIRE_FORMATS)})
         self._logger.append("Sending player name")
 
+    # Process network events from within Tk's event loop
+    def run(self):
+        self.root.after(0, self._pump_network)
+        self.root.mainloop()
+
+    # Exchange pending network data and schedule the next pump
+    def _pump_network(self):
+        connection.Pump()
+        self.Pump()
+        self.root.after(self._pump_interval, self._pump_network)
+
     """Helper functions"""
 
     # Load config from file
@@ -88,7 +135,12 @@ class Client(ConnectionListener):
                 return json.load(config)
         except Exception:
             self._logger.append(
-                "Client config could not be loaded. Make sure there is client_config.json file in your directory.")
+                "Client config could not be loaded. Make sure there is client_config.json file in your directory.",
+                ERROR)
+
+    # Milliseconds elapsed since the perf_counter value
+    def _format_duration(self, started_at: float):
+        return "{:.1f} ms".format((time.perf_counter() - started_at) * 1000)
 
     # Get player's account name (tes3mp login) from config file
     def _get_player_name(self):
@@ -96,10 +148,4 @@ class Client(ConnectionListener):
 
 
 client = Client()
-while 1:
-    connection.Pump()
-    client.Pump()
-
-    if client.overlay is not None:
-        client.overlay.root.update_idletasks()
-        client.overlay.root.update()
+client.run()
@@ -1,26 +1,191 @@
+import atexit
 import datetime
+import os
+import queue
+import threading
+import time
+
+# Severity levels
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
 
 class Logger:
     file_name_suffix = ".log"
 
+    # Seconds between flushes of the log file while records keep coming
+    flush_interval = 1.0
+
     def __init__(self, file_name_prefix: str):
         self._file_name = file_name_prefix + "-" + self._get_timestamp_file_name() + self.file_name_suffix
 
-    def append(self, text: str):
-        timestamp_str = self._get_timestamp_log()
-        log_text = "[" + timestamp_str + "] " + text
-        print(log_text)
-        self.save(log_text + "\n")
+        # Records below this level are dropped
+        self._level = INFO
+
+        # Rotate the log file once it grows over max_bytes or is older than rotate_interval seconds
+        # Zero disables the respective rotation, backup_count is the number of rotated files kept
+        self._max_bytes = 10 * 1024 * 1024
+        self._rotate_interval = 0
+        self._backup_count = 5
+
+        # Records appended with a key are logged at most once per rate_limit_interval seconds per key,
+        # the rest is counted and summarized when the interval elapses
+        self._rate_limit_interval = 60.0
+        # Key -> [start of the current interval, count of suppressed records]
+        self._rate_limits = dict()
+
+        # Records are written by a background thread so callers never wait for the console or the disk
+        self._records = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._write_records, name="logger", daemon=True)
+        self._writer.start()
+
+        # Flush whatever is left when the application exits
+        atexit.register(self.close)
 
-    def _get_timestamp_log(self):
-        return str(datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    # Apply "log" settings from config: level, max_bytes, rotate_interval, backup_count, rate_limit_interval
+    def configure(self, settings: dict):
+        level = settings.get("level", LEVEL_NAMES[self._level])
+        self._level = {name: value for value, name in LEVEL_NAMES.items()}.get(str(level).upper(), INFO)
+        self._max_bytes = settings.get("max_bytes", self._max_bytes)
+        self._rotate_interval = settings.get("rotate_interval", self._rotate_interval)
+        self._backup_count = settings.get("backup_count", self._backup_count)
+        self._rate_limit_interval = settings.get("rate_limit_interval", self._rate_limit_interval)
+
+    # Append a record, records with a key are rate limited, use it for messages repeated on every update
+    def append(self, text: str, level: int = INFO, key: str = None):
+        if level < self._level:
+            return
+        self._records.put((time.time(), level, text, key))
+
+    def _get_timestamp_log(self, timestamp: float = None):
+        if timestamp is None:
+            timestamp = time.time()
+        return str(datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S"))
 
     def _get_timestamp_file_name(self):
         return str(datetime.datetime.now().strftime("%Y-%m-%d-%H_%M_%S"))
 
     def save(self, text: str):
-        with open(self._file_name, "a") as log_file:
+        self._records.put(text)
+
+    # Write remaining records and stop the background writer
+    def close(self):
+        if self._writer.is_alive():
+            self._records.put(None)
+            self._writer.join()
+
+    def _format(self, timestamp: float, level: int, text: str):
+        if level == INFO:
+            return "[" + self._get_timestamp_log(timestamp) + "] " + text + "\n"
+        return "[" + self._get_timestamp_log(timestamp) + "] " + LEVEL_NAMES[level] + ": " + text + "\n"
+
+    # Turn queued records into lines, dropping rate limited ones
+    def _format_records(self, records: list):
+        lines = []
+        for record in records:
+            if isinstance(record, str):
+                lines.append(record)
+                continue
+
+            timestamp, level, text, key = record
+            if key is not None:
+                rate_limit = self._rate_limits.get(key)
+                if rate_limit is not None and timestamp - rate_limit[0] < self._rate_limit_interval:
+                    rate_limit[1] += 1
+                    continue
+                self._rate_limits[key] = [timestamp, 0]
+
+            lines.append(self._format(timestamp, level, text))
+        return lines
+
+    # Summarize records suppressed within intervals which have elapsed
+    def _format_summaries(self, now: float, closing: bool):
+        lines = []
+        for key, rate_limit in list(self._rate_limits.items()):
+            if not closing and now - rate_limit[0] < self._rate_limit_interval:
+                continue
+
+            if rate_limit[1] > 0:
+                lines.append(self._format(now, INFO, str(rate_limit[1]) + " more '" + key + "' message(s) in the last " +
+                                          str(int(now - rate_limit[0])) + "s"))
+            del self._rate_limits[key]
+        return lines
+
+    def _open_log_file(self):
+        try:
+            return open(self._file_name, "a")
+        except Exception:
+            print("There was an error trying to create a log file.")
+            return None
+
+    # Shift rotated files by one (server.log.1 -> server.log.2, ...) and start a new file
+    def _rotate(self, log_file):
+        log_file.close()
+        try:
+            for i in range(self._backup_count - 1, 0, -1):
+                rotated_file_name = self._file_name + "." + str(i)
+                if os.path.exists(rotated_file_name):
+                    os.replace(rotated_file_name, self._file_name + "." + str(i + 1))
+            if self._backup_count > 0:
+                os.replace(self._file_name, self._file_name + ".1")
+            else:
+                os.remove(self._file_name)
+        except OSError:
+            print("There was an error trying to rotate the log file.")
+        return self._open_log_file()
+
+    # Batch queued records into a single long-lived file handle
+    def _write_records(self):
+        log_file = self._open_log_file()
+        opened_at = time.monotonic()
+        last_flush = time.monotonic()
+        closing = False
+
+        while not closing:
             try:
-                log_file.write(text)
-            except:
-                print("There was an error trying to create a log file.")
+                batch = [self._records.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                batch = []
+
+            # Take everything queued meanwhile
+            while True:
+                try:
+                    batch.append(self._records.get_nowait())
+                except queue.Empty:
+                    break
+
+            if None in batch:
+                closing = True
+                batch = [record for record in batch if record is not None]
+
+            lines = self._format_records(batch) + self._format_summaries(time.time(), closing)
+
+            if lines:
+                text = "".join(lines)
+                print(text, end="", flush=True)
+                if log_file is not None:
+                    try:
+                        log_file.write(text)
+                    except Exception:
+                        print("There was an error trying to write into the log file.")
+
+            if log_file is None:
+                continue
+
+            if closing or time.monotonic() - last_flush >= self.flush_interval:
+                log_file.flush()
+                last_flush = time.monotonic()
+
+            # Rotate by size or age
+            too_big = self._max_bytes and log_file.tell() >= self._max_bytes
+            too_old = self._rotate_interval and time.monotonic() - opened_at >= self._rotate_interval
+            if not closing and (too_big or too_old):
+                log_file = self._rotate(log_file)
+                opened_at = time.monotonic()
+
+        if log_file is not None:
+            log_file.close()
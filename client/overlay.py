@@ -1,34 +1,106 @@
 # -*- coding: UTF-8 -*-
-from tkinter.font import Font
+import json
+import os
+import time
+from tkinter.font import Font, families
 
-from screeninfo import get_monitors
 from tkinter import *
-import pyglet
-from PIL import Image, ImageTk
+
+from stats_codec import AllyStats
+
+# screeninfo, pyglet and PIL are imported where first needed, on a warm start PIL is not imported at all
+
+# Resized frame image and layout metrics of every monitor size the overlay has been shown on
+CACHE_DIRECTORY = 'overlay_cache'
+FRAME_IMAGE_PATH = 'openmw_frame.png'
 
 
 def rgb_to_hex(rgb: tuple):
     print('#%02x%02x%02x' % (rgb[0], rgb[1], rgb[2]))
 
-class Overlay:
 
-    def __init__(self, magicka_enabled: bool, fatigue_enabled: bool):
+def get_primary_monitor_size():
+    from screeninfo import get_monitors
 
-        # Base screen dimensions for resize computation purposes
-        base_width = 1920
-        base_height = 1080
+    primary_monitor = [monitor for monitor in get_monitors() if monitor.is_primary][0]
+    return primary_monitor.width, primary_monitor.height
 
-        # Get screen dimensions
-        primary_monitor = [monitor for monitor in get_monitors() if monitor.is_primary][0]
-        self._primary_width = primary_monitor.width
-        self._primary_height = primary_monitor.height
 
-        # Get screens ratio
-        width_ratio = self._primary_width / base_width
-        height_ratio = self._primary_height / base_height
+# Register the font Morrowind is using, unless Tk already knows it (e.g. installed system-wide)
+def register_font(root: Tk):
+    if 'Magic Cards' in families(root):
+        return False
+
+    import pyglet
+
+    pyglet.font.add_file('MagicCardsNormal.ttf')
+    return True
+
+
+# Compute layout metrics for the monitor size and resize the frame image accordingly, stored into the cache
+# Returns the frame image and layout, the image is a PhotoImage of the resized file when it could be cached
+def _build_frame_layout(width: int, height: int, image_path: str, layout_path: str, source_mtime_ns: int):
+    from PIL import Image, ImageTk
+
+    # Base screen dimensions for resize computation purposes
+    base_width = 1920
+    base_height = 1080
+
+    # Get screens ratio
+    width_ratio = width / base_width
+    height_ratio = height / base_height
 
-        # Initate root window
-        self.root = Tk()
+    # Calculate font size from height ratio
+    base_font_size = 12
+    font_size = int(base_font_size * height_ratio)
+
+    layout = {'source_mtime_ns': source_mtime_ns, 'font_size': font_size,
+              'label_height': int(font_size * 2), 'label_width': int(40 * width_ratio)}
+
+    # Load up frame image and resize it according to the primary screen dimensions
+    base_frame_image = Image.open(FRAME_IMAGE_PATH)
+    resized_frame_image = base_frame_image.resize(
+        (int(width_ratio * base_frame_image.size[0]), int(height_ratio * base_frame_image.size[1])), Image.LANCZOS)
+
+    try:
+        os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+        resized_frame_image.save(image_path)
+        with open(layout_path, 'w') as layout_file:
+            json.dump(layout, layout_file)
+    except OSError:
+        return ImageTk.PhotoImage(resized_frame_image), layout
+
+    return PhotoImage(file=image_path), layout
+
+
+# Get frame image and layout metrics for the monitor size, from the cache if the frame image has not changed since
+# Tk reads PNG on its own, so a cache hit needs neither PIL nor any resizing
+def load_frame_layout(width: int, height: int):
+    key = str(width) + 'x' + str(height)
+    image_path = os.path.join(CACHE_DIRECTORY, key + '.png')
+    layout_path = os.path.join(CACHE_DIRECTORY, key + '.json')
+    source_mtime_ns = os.stat(FRAME_IMAGE_PATH).st_mtime_ns
+
+    try:
+        with open(layout_path) as layout_file:
+            layout = json.load(layout_file)
+        if layout['source_mtime_ns'] == source_mtime_ns:
+            return PhotoImage(file=image_path), layout, True
+    except (OSError, ValueError, KeyError, TclError):
+        pass
+
+    frame_image, layout = _build_frame_layout(width, height, image_path, layout_path, source_mtime_ns)
+    return frame_image, layout, False
+
+class Overlay:
+
+    def __init__(self, root: Tk, magicka_enabled: bool, fatigue_enabled: bool, max_fps: int = 30):
+
+        # Get screen dimensions
+        self._primary_width, self._primary_height = get_primary_monitor_size()
+
+        # Use root window created by the client
+        self.root = root
 
         '''Set window parameters'''
 
@@ -42,13 +114,15 @@ class Overlay:
         self.root.wm_attributes('-topmost', True)
         self.root.wm_attributes('-transparent', 'purple')
         self.root.configure(background='purple')
+        self.root.deiconify()
 
         # Add custom font that Morrowind is using
-        pyglet.font.add_file('MagicCardsNormal.ttf')
+        self._font_registered = register_font(self.root)
 
-        # Calculate font size from height ratio
-        base_font_size = 12
-        self._font_size = int(base_font_size * height_ratio)
+        # Frame image resized according to the primary screen dimensions and sizes derived from them
+        self._frame_image, layout, self._layout_cached = load_frame_layout(self._primary_width,
+                                                                           self._primary_height)
+        self._font_size = layout['font_size']
 
         # Define fonts
         # Font color from Morrowind.ini
@@ -66,24 +140,28 @@ class Overlay:
         # Limit amount of frames on display
         self._frames_limit = 8
 
-        # Track how many frames there are
-        self._frames_count = 0
+        # Frames bound to players by player name
+        self._frames = dict()
+
+        # Player names in order of their frames on screen, frame's index is its slot
+        self._slots = list()
 
-        # Store created frames here
-        self._frames = list()
+        # Latest known AllyStats of every ally, including those without a frame due to the frames limit
+        self._allies_data = dict()
 
-        # Load up frame image and resize it according to the primary screen dimensions
-        base_frame_image = (Image.open('openmw_frame.png'))
-        base_frame_image_width = base_frame_image.size[0]
-        base_frame_image_height = base_frame_image.size[1]
+        # Allies changed or removed since the last render pass, network messages only mark them here
+        # Changed names are dict keys so that frames are created in the order the allies arrived in
+        self._dirty_names = dict()
+        self._dirty_removed = set()
 
-        resized_frame_image = base_frame_image.resize(
-            (int(width_ratio * base_frame_image_width), int(height_ratio * base_frame_image_height)), Image.ANTIALIAS)
-        self._frame_image = ImageTk.PhotoImage(resized_frame_image)
+        # Render passes run at most max_fps times per second, one pass applies every change made meanwhile
+        self._render_interval = 1 / max_fps if max_fps > 0 else 0
+        self._last_render = 0.0
+        self._render_scheduled = False
 
         # Define label properties
-        self._label_height = int(self._font_size * 2)
-        self._label_width = int(40 * width_ratio)
+        self._label_height = layout['label_height']
+        self._label_width = layout['label_width']
 
         # Offset between tops of two frames (bottom of frame 1's label and top of frame 2's label)
         # Defined as height of the whole frame + padding represented by double the font size
@@ -95,7 +173,7 @@ class Overlay:
         if self._fatigue_enabled:
             self._frame_y_offset += self._frame_image.height()
 
-        # Health bar gradient is achieved drawing single lines of different shades of red, similarly to magicka and fatigue
+        # Health bar gradient consists of rows of different shades of red, similarly to magicka and fatigue
         self.health_bar_gradient = ['#d6a684', '#d9ad8f', '#debaa5', '#dbb39a', '#d69a7b', '#cb8265', '#c0694f',
                                     '#b55139',
                                     '#b54d39', '#a43f34', '#a43f34', '#9c3831', '#97352c']
@@ -108,44 +186,43 @@ class Overlay:
                                      '#6bb239',
                                      '#6baa39', '#6ba336', '#6b9d34', '#6b9631', '#638e31']
 
+        # Gradient strips of every bar width in use, keyed by gradient and width in pixels
+        self._gradient_images = dict()
+
         # Create canvas and place it within the window
         self._canvas = Canvas(self.root, bg='purple', highlightthickness=0)
         self._canvas.pack(fill=BOTH, expand=True)
 
-    # Create level and name label for frame
-    def _create_label(self, start_y: int, player_name: str, level: int):
-        label = LabelBar(self, start_y, player_name, level)
-        return label
+        # Pool of hidden frames, allocated once up to the frames limit and rebound to allies as they come and go
+        # Popped from the end, so the first frame used is the one created in the first slot
+        self._free_frames = [AllyFrame(self, slot) for slot in reversed(range(self._frames_limit))]
 
-    # Create health bar within the frame
-    def _create_health_bar(self, start_y: int, base_health: float, current_health: float):
-        health_bar = Bar(self, start_y, base_health, current_health, self.health_bar_gradient)
-        return health_bar
+    # Get image of the gradient (one row of pixels per color) with the given width
+    # Images are rendered once per width so a bar update only swaps the image of its canvas item
+    def get_gradient_image(self, color_gradient: tuple, width: int):
+        key = (color_gradient, width)
+        image = self._gradient_images.get(key)
 
-    # Create magicka bar within the frame
-    def _create_magicka_bar(self, start_y: int, base_magicka: float, current_magicka: float):
-        magicka_bar = Bar(self, start_y, base_magicka, current_magicka, self.magicka_bar_gradient)
-        return magicka_bar
+        if image is None:
+            image = PhotoImage(width=width, height=len(color_gradient))
+            for row, color in enumerate(color_gradient):
+                image.put(color, to=(0, row, width, row + 1))
+            self._gradient_images[key] = image
 
-    # Create fatigue bar within the frame
-    def _create_fatigue_bar(self, start_y, base_fatigue: float, current_fatigue: float):
-        fatigue_bar = Bar(self, start_y, base_fatigue, current_fatigue, self.fatigue_bar_gradient)
-        return fatigue_bar
+        return image
 
+    # Bind a free frame of the pool to the player and show it in the first free slot
     def _create_frame(self, player_name: str, level: int, base_health: float, current_health: float,
                       base_magicka: float, current_magicka: float, base_fatigue: float, current_fatigue: float):
         # Do not create further frames if the limit has been reached
-        if self._frames_count >= self._frames_limit:
+        if len(self._slots) >= self._frames_limit:
             return
 
         # Do not create frame for already existing name
-        if self._get_index_frame_pair_by_player_name(player_name) is not None:
+        if player_name in self._frames:
             print('Unable to create frame for ', player_name)
             return
 
-        # Calculate position of the new frame
-        start_y = self._frames_count * self._frame_y_offset
-
         '''Name correction'''
         # Replace space with unicode representation (regular spaces do not seem to work using Magic Cards font here)
         fixed_name = player_name.replace(' ', '\u2800')
@@ -153,33 +230,13 @@ class Overlay:
         if len(fixed_name) > self._name_limit:
             fixed_name = fixed_name[:self._name_limit]
 
-        # Level and name label
-        label_bar = self._create_label(start_y, fixed_name, level)
-
-        # Create stats bars
-        health_bar = self._create_health_bar(start_y, base_health, current_health)
-        magicka_bar = None
-        fatigue_bar = None
-
-        bars_count = 1
-        # Create magicka bar if enabled
-        if self._magicka_enabled:
-            magicka_bar = self._create_magicka_bar(start_y + self._frame_image.height() - 1, base_magicka,
-                                                   current_magicka)
-            bars_count += 1
+        frame = self._free_frames.pop()
+        frame.bind(player_name, fixed_name, len(self._slots), level, base_health, current_health, base_magicka,
+                   current_magicka, base_fatigue, current_fatigue)
 
-        # Create fatigue bar if enabled
-        if self._fatigue_enabled:
-            fatigue_bar = self._create_fatigue_bar(start_y + bars_count * (self._frame_image.height() - 1), base_fatigue,
-                                                   current_fatigue)
+        self._frames[player_name] = frame
+        self._slots.append(player_name)
 
-        # Define frame data and append it to list
-        frame_data = {'name': player_name, 'label': label_bar,
-                      'bars': {'health': health_bar, 'magicka': magicka_bar, 'fatigue': fatigue_bar}}
-        self._frames.append(frame_data)
-
-        # Track how many frames are there in the screen
-        self._frames_count += 1
         self._canvas.configure(scrollregion=self.canvas.bbox(ALL))
 
     def _update_frame(self, player_name: str, level: int, base_health: float, current_health: float,
@@ -190,64 +247,103 @@ class Overlay:
         if frame is None:
             return
 
-        old_level = frame['label'].level
+        old_level = frame.label.level
 
         if level != old_level:
-            frame['label'].update(level)
+            frame.label.update(level)
 
-        old_base_health = frame['bars']['health'].base
-        old_current_health = frame['bars']['health'].current
+        old_base_health = frame.bars['health'].base
+        old_current_health = frame.bars['health'].current
 
         if old_base_health != base_health or old_current_health != current_health:
-            frame['bars']['health'].update(base_health, current_health)
+            frame.bars['health'].update(base_health, current_health)
 
         if self._magicka_enabled:
-            old_base_magicka = frame['bars']['magicka'].base
-            old_current_magicka = frame['bars']['magicka'].current
+            old_base_magicka = frame.bars['magicka'].base
+            old_current_magicka = frame.bars['magicka'].current
 
             if old_base_magicka != base_magicka or old_current_magicka != current_magicka:
-                frame['bars']['magicka'].update(base_magicka, current_magicka)
+                frame.bars['magicka'].update(base_magicka, current_magicka)
 
         if self._fatigue_enabled:
-            old_base_fatigue = frame['bars']['fatigue'].base
-            old_current_fatigue = frame['bars']['fatigue'].current
+            old_base_fatigue = frame.bars['fatigue'].base
+            old_current_fatigue = frame.bars['fatigue'].current
 
             if old_base_fatigue != base_fatigue or old_current_fatigue != current_fatigue:
-                frame['bars']['fatigue'].update(base_fatigue, current_fatigue)
+                frame.bars['fatigue'].update(base_fatigue, current_fatigue)
 
+    # Replace all allies data, allies missing in player_data get their frames destroyed
     def update_frames(self, player_data: dict):
         if player_data is None:
             return
 
-        # Add all names for removal
-        player_names_to_remove = [frame['name'] for frame in self._frames]
+        removed = [name for name in self._allies_data if name not in player_data]
+        self.patch_frames(player_data, removed)
+
+    # Apply changed allies data and remove allies, frames are redrawn by the next render pass
+    # Changed entries are either AllyStats or stats dicts, dicts of already known allies
+    # may only contain the fields that have changed
+    def patch_frames(self, changed: dict, removed: list):
+        for name in removed:
+            if name in self._allies_data:
+                del self._allies_data[name]
+                self._dirty_names.pop(name, None)
+                self._dirty_removed.add(name)
+
+        for name, stats in changed.items():
+            if not isinstance(stats, AllyStats):
+                name_data = self._allies_data.get(name)
+                stats = AllyStats.from_dict(stats) if name_data is None else name_data.updated(stats)
 
-        # Filter names for which bars should be created or updated
-        # Remove names for which any of the create or update action has NOT been executed
-        for name in player_data:
-            name_data = player_data[name]
+            self._allies_data[name] = stats
+            self._dirty_names[name] = None
+
+        self._schedule_render()
+
+    # Schedule a render pass unless one is pending, no sooner than the render interval after the last one
+    def _schedule_render(self):
+        if self._render_scheduled or not (self._dirty_names or self._dirty_removed):
+            return
 
-            level = name_data['level']
-            base_health = name_data['baseHealth']
-            current_health = name_data['currentHealth']
-            base_magicka = name_data['baseMagicka']
-            current_magicka = name_data['currentMagicka']
-            base_fatigue = name_data['baseFatigue']
-            current_fatigue = name_data['currentFatigue']
+        self._render_scheduled = True
+        delay = self._last_render + self._render_interval - time.monotonic()
+        self.root.after(max(int(delay * 1000), 0), self._render)
+
+    # Apply all changes accumulated since the last render pass in one batch
+    def _render(self):
+        self._render_scheduled = False
+        self._last_render = time.monotonic()
+
+        removed = self._dirty_removed
+        changed = self._dirty_names
+        self._dirty_removed = set()
+        self._dirty_names = dict()
+
+        # Allies removed and added back since the last pass keep their frame
+        for name in removed:
+            if name not in self._allies_data:
+                self._destroy_frame(name)
+
+        for name in changed:
+            name_data = self._allies_data[name]
 
             # Frame for such name doesn't exist, create one
-            if name not in player_names_to_remove:
-                self._create_frame(name, level, base_health, current_health, base_magicka, current_magicka,
-                                   base_fatigue, current_fatigue)
+            if self._get_frame_by_name(name) is None:
+                self._create_frame_from_data(name, name_data)
             # Frame exists execute an update
             else:
-                self._update_frame(name, level, base_health, current_health, base_magicka, current_magicka,
-                                   base_fatigue, current_fatigue)
-                player_names_to_remove.remove(name)
+                self._update_frame(name, *name_data.as_tuple())
+
+        # Removals might have freed space for allies that did not fit within the frames limit
+        if removed:
+            for name in self._allies_data:
+                if len(self._slots) >= self._frames_limit:
+                    break
+                if name not in self._frames:
+                    self._create_frame_from_data(name, self._allies_data[name])
 
-        # Destroy health frames for remaining names in the list
-        for name in player_names_to_remove:
-            self._destroy_frame(name)
+    def _create_frame_from_data(self, name: str, name_data: AllyStats):
+        self._create_frame(name, *name_data.as_tuple())
 
     # Store a point of mouse pressed on either level_frame, level_text, name_frame or name_text
     # prior to dragging, canvas elements (our frames) are dragged relative to this point
@@ -260,82 +356,28 @@ class Overlay:
 
         self._canvas.scan_dragto(event.x, event.y, 1)
 
-    # Only append frame if the player_name is unique throughout the list
-    def _insert_frame(self, frame_data):
-        index_frame_pair = self._get_index_frame_pair_by_player_name(frame_data['name'])
-
-        if index_frame_pair is None:
-            self._frames.append(frame_data)
-            return True
-
-        return False
-
-    # If existent, return index (of frame) and frame as a tuple
-    # If nonexistent, return None
-    def _get_index_frame_pair_by_player_name(self, player_name: str):
-        try:
-            index_frame_pair = \
-                [(i, self._frames[i]) for i in range(len(self._frames)) if self._frames[i]['name'] == player_name][0]
-            return index_frame_pair
-        except IndexError:
-            return None
-
-    # Get only frame from name
+    # Get frame from name, None if the player has no frame
     def _get_frame_by_name(self, player_name: str):
-        index_frame_pair = self._get_index_frame_pair_by_player_name(player_name)
-
-        if index_frame_pair is None:
-            return None
+        return self._frames.get(player_name)
 
-        return index_frame_pair[1]
+    # Hide the frame and return it to the pool
+    # Frames in the slots below the freed one move up by one slot each
+    def _destroy_frame(self, player_name):
+        frame = self._frames.pop(player_name, None)
 
-    # When a frame is removed any frames below that frame shall be moved upwards by distance between
-    # the removed frame and next frame in the sequence
-    def _move_frame_on_removal(self, frame, dy):
-        label_bar = frame['label']
-        label_bar.move(dy)
+        # Check if frame for such player name has been found
+        if frame is None:
+            return
 
-        for bar_key in frame['bars']:
-            stats_bar = frame['bars'][bar_key]
-            stats_bar.move(dy)
+        slot = frame.slot
+        frame.release()
+        self._free_frames.append(frame)
+        del self._slots[slot]
 
-    # Destroy visual representation of the frame and eventually remove the frame from the list
-    # Also update the position of the frames below the one being removed
-    def _destroy_frame(self, player_name):
-        index_frame_pair = self._get_index_frame_pair_by_player_name(player_name)
+        for i in range(slot, len(self._slots)):
+            self._frames[self._slots[i]].move_to_slot(i)
 
-        # Check if frame for such player name has been found
-        if index_frame_pair is not None:
-            frame = index_frame_pair[1]
-            label_bar = frame['label']
-            label_bar_coords = label_bar.get_coords()
-
-            # Destroy visual representation of frame's components
-            label_bar.destroy()
-
-            for bar_key in frame['bars']:
-                stats_bar = frame['bars'][bar_key]
-                stats_bar.destroy()
-
-            # Update height of frames lower in canvas
-
-            # Distance by which will all remaining frame components shall be moved
-            dy = None
-            for i in range(index_frame_pair[0] + 1, len(self._frames)):
-                update_frame = self._frames[i]
-                # Obtain height by which will all remaining frame components shall be moved
-                # as a distance between frame to be removed and the next frame below
-                if dy is None:
-                    update_label_bar_coords = update_frame['label'].get_coords()
-                    dy = label_bar_coords[1] - update_label_bar_coords[1]
-
-                # Update below frame's position
-                self._move_frame_on_removal(update_frame, dy)
-
-            # Remove frame from list, update total frames count and frames' region within canvas
-            self._frames.remove(frame)
-            self._frames_count -= 1
-            self._canvas.configure(scrollregion=self.canvas.bbox(ALL))
+        self._canvas.configure(scrollregion=self.canvas.bbox(ALL))
 
     @property
     def canvas(self):
@@ -361,6 +403,22 @@ class Overlay:
     def label_width(self):
         return self._label_width
 
+    @property
+    def magicka_enabled(self):
+        return self._magicka_enabled
+
+    @property
+    def fatigue_enabled(self):
+        return self._fatigue_enabled
+
+    @property
+    def layout_cached(self):
+        return self._layout_cached
+
+    @property
+    def font_registered(self):
+        return self._font_registered
+
     @property
     def font_size(self):
         return self._font_size
@@ -378,15 +436,98 @@ class Overlay:
         return self._name_font
 
 
+# Label and stats bars of one ally, every canvas item of the frame carries the frame's tag
+# so the whole frame is moved, shown or hidden by a single canvas call
+class AllyFrame:
+
+    def __init__(self, overlay: Overlay, slot: int):
+        self._overlay = overlay
+        self._tag = 'frame' + str(slot)
+        self._slot = slot
+        self._name = None
+
+        start_y = slot * overlay.frame_y_offset
+        bar_height = overlay.frame_image.height() - 1
+
+        # Level and name label
+        self._label = LabelBar(overlay, self._tag, start_y, '', 0)
+
+        # Stats bars, magicka and fatigue only if enabled
+        self._bars = {'health': Bar(overlay, self._tag, start_y, 0, 0, overlay.health_bar_gradient),
+                      'magicka': None, 'fatigue': None}
+
+        bars_count = 1
+        if overlay.magicka_enabled:
+            self._bars['magicka'] = Bar(overlay, self._tag, start_y + bar_height, 0, 0, overlay.magicka_bar_gradient)
+            bars_count += 1
+
+        if overlay.fatigue_enabled:
+            self._bars['fatigue'] = Bar(overlay, self._tag, start_y + bars_count * bar_height, 0, 0,
+                                        overlay.fatigue_bar_gradient)
+
+        # Frames wait hidden in the pool until bound to a player
+        self.release()
+
+    # Rebind the frame to a player, place it in the slot and show it
+    def bind(self, player_name: str, display_name: str, slot: int, level: int, base_health: float,
+             current_health: float, base_magicka: float, current_magicka: float, base_fatigue: float,
+             current_fatigue: float):
+        self._name = player_name
+        self.move_to_slot(slot)
+
+        self._label.rebind(display_name, level)
+        self._bars['health'].update(base_health, current_health)
+        if self._bars['magicka'] is not None:
+            self._bars['magicka'].update(base_magicka, current_magicka)
+        if self._bars['fatigue'] is not None:
+            self._bars['fatigue'].update(base_fatigue, current_fatigue)
+
+        self._overlay.canvas.itemconfigure(self._tag, state=NORMAL)
+        # Empty gradients stay hidden
+        for bar in self._bars.values():
+            if bar is not None:
+                bar.set_visible(True)
+
+    # Hide the frame, it keeps its items for the next player
+    def release(self):
+        self._name = None
+        self._overlay.canvas.itemconfigure(self._tag, state=HIDDEN)
+        for bar in self._bars.values():
+            if bar is not None:
+                bar.set_visible(False)
+
+    # Slots are a frame_y_offset apart, so moving between slots is a single move of the tag
+    def move_to_slot(self, slot: int):
+        if slot != self._slot:
+            self._overlay.canvas.move(self._tag, 0, (slot - self._slot) * self._overlay.frame_y_offset)
+            self._slot = slot
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def slot(self):
+        return self._slot
+
+    @property
+    def label(self):
+        return self._label
+
+    @property
+    def bars(self):
+        return self._bars
+
+
 class LabelBar:
-    def __init__(self, overlay: Overlay, start_y: int, player_name: str, level: int):
+    def __init__(self, overlay: Overlay, tag: str, start_y: int, player_name: str, level: int):
         self._overlay = overlay
 
         self._level = level
 
         self._level_frame = overlay.canvas.create_rectangle(0, start_y, overlay.label_width,
                                                             start_y + overlay.label_height, outline=overlay.font_color,
-                                                            fill='black')
+                                                            fill='black', tags=tag)
         overlay.canvas.tag_bind(self._level_frame, '<ButtonPress-1>', overlay.move_mark)
         overlay.canvas.tag_bind(self._level_frame, '<B1-Motion>', overlay.move_canvas)
 
@@ -395,14 +536,15 @@ class LabelBar:
                               level_frame_coords[3] - (level_frame_coords[3] - level_frame_coords[1]) / 2 + 2)
 
         self._level_text = overlay.canvas.create_text(level_frame_center[0], level_frame_center[1],
-                                                      fill=overlay.font_color, text=level, font=overlay.level_font)
+                                                      fill=overlay.font_color, text=level, font=overlay.level_font,
+                                                      tags=tag)
         overlay.canvas.tag_bind(self._level_text, '<ButtonPress-1>', overlay.move_mark)
         overlay.canvas.tag_bind(self._level_text, '<B1-Motion>', overlay.move_canvas)
 
         self._name_frame = overlay.canvas.create_rectangle(overlay.label_width, start_y,
                                                            overlay.label_width + overlay.frame_image.width() - 1,
                                                            start_y + overlay.label_height, outline=overlay.font_color,
-                                                           fill='black')
+                                                           fill='black', tags=tag)
         overlay.canvas.tag_bind(self._name_frame, '<ButtonPress-1>', overlay.move_mark)
         overlay.canvas.tag_bind(self._name_frame, '<B1-Motion>', overlay.move_canvas)
 
@@ -412,7 +554,8 @@ class LabelBar:
                              name_frame_coords[3] - (name_frame_coords[3] - name_frame_coords[1]) / 2 + 2)
 
         self._name_text = overlay.canvas.create_text(name_frame_center[0], name_frame_center[1],
-                                                     fill=overlay.font_color, text=player_name, font=overlay.name_font)
+                                                     fill=overlay.font_color, text=player_name, font=overlay.name_font,
+                                                     tags=tag)
         overlay.canvas.tag_bind(self._name_text, '<ButtonPress-1>', overlay.move_mark)
         overlay.canvas.tag_bind(self._name_text, '<B1-Motion>', overlay.move_canvas)
 
@@ -421,22 +564,14 @@ class LabelBar:
         self._level = level
         self._overlay.canvas.itemconfig(self._level_text, text=str(level))
 
+    # Show another player's name and level in the same label
+    def rebind(self, player_name: str, level: int):
+        self._overlay.canvas.itemconfig(self._name_text, text=player_name)
+        self.update(level)
+
     def get_coords(self):
         return self._overlay.canvas.coords(self._level_frame)
 
-    def move(self, dy):
-        self._overlay.canvas.move(self._level_frame, 0, dy)
-        self._overlay.canvas.move(self._level_text, 0, dy)
-        self._overlay.canvas.move(self._name_frame, 0, dy)
-        self._overlay.canvas.move(self._name_text, 0, dy)
-
-    # Destroy visual representation
-    def destroy(self):
-        self._overlay.canvas.delete(self._level_frame)
-        self._overlay.canvas.delete(self._level_text)
-        self._overlay.canvas.delete(self._name_frame)
-        self._overlay.canvas.delete(self._name_text)
-
     @property
     def level_frame(self):
         return self._level_frame
@@ -452,78 +587,79 @@ class LabelBar:
 
 class Bar:
 
-    def __init__(self, overlay: Overlay, start_y: int, base: float, current: float, color_gradient: list):
+    def __init__(self, overlay: Overlay, tag: str, start_y: int, base: float, current: float, color_gradient: list):
         self._overlay = overlay
 
         self._base = base
         self._current = current
 
         self._frame = overlay.canvas.create_image(40, overlay.label_height + start_y,
-                                                  image=overlay.frame_image, anchor=NW)
+                                                  image=overlay.frame_image, anchor=NW, tags=tag)
 
-        self._lines = []
+        self._color_gradient = tuple(color_gradient)
 
         # Coordinates of bar frame in canvas
         self._frame_x0 = overlay.canvas.coords(self._frame)[0]
         self._frame_x1 = self._frame_x0 + overlay.frame_image.width()
 
-        # Keep small space between lines and bar frame edges
+        # Keep small space between gradient and bar frame edges
         self._lines_x0 = self._frame_x0 + 2
         self._lines_x1 = self._frame_x1 - 2
 
-        # Adjust lines to be drawn inside inner part of bar frame
+        # Adjust gradient to be drawn inside inner part of bar frame
         # Offset from top bar frame border
         self._lines_frame_offset_y = 2
 
-        # Get max lines width
+        # Get max gradient width
         self._lines_max_width = self._lines_x1 - self._lines_x0
 
-        '''Draw the lines finally'''
-        # Despite HP not being neccessarily full, draw lines for full hp and update it later
-        for i in range(len(color_gradient)):
-            color = color_gradient[i]
-            line = overlay.canvas.create_line(self._lines_x0,
-                                              start_y + self._lines_frame_offset_y + overlay.label_height + i,
-                                              self._lines_x1,
-                                              start_y + self._lines_frame_offset_y + overlay.label_height + i,
-                                              fill=color, width=1)
-            self._lines.append(line)
+        # Width of the gradient currently displayed
+        self._width = None
+
+        # Gradient is only shown while the frame is visible
+        self._visible = True
+
+        # Gradient image is swapped for one of matching width on update
+        self._gradient = overlay.canvas.create_image(self._lines_x0,
+                                                     start_y + self._lines_frame_offset_y + overlay.label_height,
+                                                     anchor=NW, state=HIDDEN, tags=tag)
 
         self.update(base, current)
 
     # Get ratio from base and current values
     def _calculate_ratio(self, base: float, current: float):
-        return current / base
+        if base <= 0:
+            return 0
+        return min(max(current / base, 0), 1)
 
     def get_coords(self):
         return self._overlay.canvas.coords(self._frame)
 
-    def move(self, dy):
-        self._overlay.canvas.move(self._frame, 0, dy)
+    # Show or hide the gradient along with its frame, an empty gradient stays hidden
+    def set_visible(self, visible: bool):
+        self._visible = visible
+        state = NORMAL if visible and self._width else HIDDEN
+        self._overlay.canvas.itemconfig(self._gradient, state=state)
 
-        for line in self._lines:
-            self._overlay.canvas.move(line, 0, dy)
-
-    # Update lines width
+    # Update gradient width
     def update(self, base: float, current: float):
         self._base = base
         self._current = current
 
         # Calculate ratio
         ratio = self._calculate_ratio(base, current)
+        width = int(self._lines_max_width * ratio)
 
-        # Adjust lines' width
-        for line in self._lines:
-            line_x0 = self._overlay.canvas.coords(line)[0]
-            line_y0 = self._overlay.canvas.coords(line)[1]
-            self._overlay.canvas.coords(line, line_x0, line_y0,
-                                        int(self._lines_max_width * ratio + self._lines_x0), line_y0)
+        if width == self._width:
+            return
+        self._width = width
 
-    # Destroy visual representation of the object
-    def destroy(self):
-        for line in self._lines:
-            self._overlay.canvas.delete(line)
-        self._overlay.canvas.delete(self._frame)
+        # A single item configuration instead of adjusting every line of the gradient
+        if width > 0:
+            self._overlay.canvas.itemconfig(self._gradient, image=self._overlay.get_gradient_image(
+                self._color_gradient, width), state=NORMAL if self._visible else HIDDEN)
+        else:
+            self._overlay.canvas.itemconfig(self._gradient, state=HIDDEN)
 
     @property
     def base(self):
@@ -531,4 +667,4 @@ class Bar:
 
     @property
     def current(self):
-        return self._current
\ No newline at end of file
+        return self._current
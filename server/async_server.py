@@ -0,0 +1,168 @@
+import asyncio
+import sys
+
+from PodSixNet.rencode import dumps, loads
+
+from ingest_server import create_ingest_server_from_config
+from json_loader import JsonLoader
+from logger import Logger
+from metrics import create_stats_publisher_from_config
+from server_core import ClientState, ServerCore
+from snapshot_reader import create_snapshot_readers
+
+"""asyncio server engine speaking the same protocol as PodSixNet
+All methods starting with capital letter are network related"""
+
+# Message terminator used by PodSixNet channels
+TERMINATOR = b"\0---\0"
+
+
+class AsyncClientChannel(ClientState, asyncio.Protocol):
+
+    def __init__(self, server):
+        ClientState.__init__(self)
+        self._server = server
+        self._transport = None
+        self._ibuffer = b""
+        self._closed = False
+
+    def connection_made(self, transport):
+        self._transport = transport
+        self.Send({"action": "connected"})
+        self.server.Connected(self, transport.get_extra_info("peername"))
+
+    # Split the stream into messages and dispatch them the same way PodSixNet's Channel does
+    def data_received(self, data):
+        self._ibuffer += data
+
+        while not self._closed:
+            end = self._ibuffer.find(TERMINATOR)
+            if end < 0:
+                return
+
+            message = loads(self._ibuffer[:end])
+            self._ibuffer = self._ibuffer[end + len(TERMINATOR):]
+
+            if isinstance(message, dict) and "action" in message:
+                for name in ("Network_" + message["action"], "Network"):
+                    if hasattr(self, name):
+                        getattr(self, name)(message)
+            else:
+                print("OOB data:", message)
+
+    def connection_lost(self, exc):
+        if not self._closed:
+            self.Close()
+
+    # Returns the number of bytes sent after encoding
+    def Send(self, data):
+        outgoing = dumps(data) + TERMINATOR
+        if not self._closed:
+            self._transport.write(outgoing)
+        return len(outgoing)
+
+    def close(self):
+        self._closed = True
+        self._transport.close()
+
+    # Bytes written to the transport and not yet sent
+    def buffered_bytes(self):
+        return self._transport.get_write_buffer_size()
+
+
+class AsyncServer(ServerCore):
+
+    def __init__(self, logger: Logger, json_loader: JsonLoader):
+        ServerCore.__init__(self, logger, json_loader)
+
+        self._listener = None
+        # Set whenever verification or fan-out may have work to do
+        self._updates_requested = asyncio.Event()
+
+    async def start(self):
+        address = self.json_loader.config["local_address"]
+        port = self.json_loader.config["port"]
+        loop = asyncio.get_running_loop()
+        self._listener = await loop.create_server(lambda: AsyncClientChannel(self), address, port)
+        self.logger.append("Server launched")
+
+    def add_client_awaiting_tes3mp_ip(self, client):
+        ServerCore.add_client_awaiting_tes3mp_ip(self, client)
+        self._updates_requested.set()
+
+    # Swap in players' data of the source whenever its reader has built a new snapshot
+    async def ingest_snapshots(self, reader):
+        async for _ in self._wait_readable(reader.fileno()):
+            snapshot = reader.consume()
+            if snapshot is not None and reader.json_loader.swap_snapshot(snapshot):
+                self._updates_requested.set()
+
+    # Swap in snapshots the ingest handlers have built of players' data pushed over the local socket
+    async def ingest_pushed_snapshots(self, ingest):
+        async for _ in self._wait_readable(ingest.fileno()):
+            if self.swap_pushed_snapshots(ingest.consume()):
+                self._updates_requested.set()
+
+    # Verify clients and fan out allies data once per batch of requests
+    # Come back once a throttled client may be sent its pending allies data
+    async def process_updates(self):
+        loop = asyncio.get_running_loop()
+        retry = None
+
+        while True:
+            await self._updates_requested.wait()
+            self._updates_requested.clear()
+            self.update_clients()
+
+            if retry is not None:
+                retry.cancel()
+                retry = None
+            send_delay = self.get_send_delay()
+            if send_delay is not None:
+                retry = loop.call_later(send_delay, self._updates_requested.set)
+
+    # Readers are SnapshotReaders of the sources read from a file
+    async def serve(self, readers: list, ingest):
+        await self.start()
+        tasks = [self.process_updates()]
+
+        for reader in readers:
+            tasks.append(self.ingest_snapshots(reader))
+        if ingest is not None:
+            tasks.append(self.ingest_pushed_snapshots(ingest))
+        self._updates_requested.set()
+
+        async with self._listener:
+            await asyncio.gather(*tasks)
+
+    # Yield every time the file descriptor becomes readable
+    async def _wait_readable(self, fd: int):
+        loop = asyncio.get_running_loop()
+        readable = asyncio.Event()
+        loop.add_reader(fd, readable.set)
+
+        try:
+            while True:
+                await readable.wait()
+                readable.clear()
+                yield
+        finally:
+            loop.remove_reader(fd)
+
+
+def run_async_server(logger: Logger, json_loader: JsonLoader):
+    # The proactor loop used by default on Windows cannot watch file descriptors
+    if sys.platform == "win32":
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    config = json_loader.config
+    source = config.get("source", "file")
+    server = AsyncServer(logger, json_loader)
+
+    readers = create_snapshot_readers(config, server.sources, logger, server.metrics) if source in ("file", "both") \
+        else []
+    ingest = create_ingest_server_from_config(config, logger, server.sources, server.metrics) \
+        if source in ("socket", "both") else None
+
+    create_stats_publisher_from_config(config, server.metrics, logger)
+    asyncio.run(server.serve(readers, ingest))
@@ -0,0 +1,95 @@
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from json_loader import JsonLoader
+from logger import Logger
+from stand_in_producer import StandInProducer
+from stats_codec import AllyStats
+
+"""Measure memory held by players' data as parsed JSON dicts and as validated AllyStats records
+Also compares the client's allies data model kept as stats dicts and as AllyStats, results are per 1000 players
+Usage: python memory.py --players 1000 10000 [--party-size 4]"""
+
+
+# Bytes allocated by build() and still held by the returned object
+def measure_retained(build):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    retained = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del retained
+    return size
+
+
+def run_scenario(players: int, party_size: int, alliance_graph: str):
+    logger = Logger(os.path.join(tempfile.gettempdir(), "alliedstats-memory"))
+    logger.configure({"level": "warning"})
+    json_loader = JsonLoader(logger, {"file_path": None}, {"name": "benchmark", "file_path": None})
+
+    producer = StandInProducer(players, party_size, seed=0, alliance_graph=alliance_graph)
+    content = json.dumps(producer.get_players_data())
+
+    # What the server held before validation turned allies' stats into records
+    parsed_bytes = measure_retained(lambda: json.loads(content))
+
+    # Validated data keeps the parsed names, ips and numbers but none of the parsed dicts of stats
+    def validate():
+        return json_loader._validate_player_data(json.loads(content))
+    validated_bytes = measure_retained(validate)
+
+    # Client's overlay model holds the stats of its allies, the same amount summed over all clients
+    allies_stats = [stats for data in json.loads(content).values() for stats in data["alliesData"].values()]
+    client_dict_bytes = measure_retained(lambda: [dict(stats) for stats in allies_stats])
+    client_records_bytes = measure_retained(lambda: [AllyStats.from_dict(stats) for stats in allies_stats])
+
+    per_thousand = 1000 / players
+    return {"players": players, "party_size": party_size, "alliance_graph": alliance_graph,
+            "allies_records": len(allies_stats),
+            "server_parsed_bytes": int(parsed_bytes * per_thousand),
+            "server_validated_bytes": int(validated_bytes * per_thousand),
+            "client_dict_bytes": int(client_dict_bytes * per_thousand),
+            "client_records_bytes": int(client_records_bytes * per_thousand)}
+
+
+def print_report(report: dict):
+    print("{players} players, alliances of {party_size} ({alliance_graph}), {allies_records} ally stats".format(
+        **report))
+    print("  {:<44}{:>14}".format("per 1000 players", "bytes"))
+    print("  {:<44}{:>14}".format("server, parsed JSON dicts", report["server_parsed_bytes"]))
+    print("  {:<44}{:>14}".format("server, validated AllyStats records", report["server_validated_bytes"]))
+    print("  {:<44}{:>14}".format("clients' allies data, stats dicts", report["client_dict_bytes"]))
+    print("  {:<44}{:>14}".format("clients' allies data, AllyStats", report["client_records_bytes"]))
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure memory held by players' data per 1000 players")
+    parser.add_argument("--players", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--party-size", type=int, default=4)
+    parser.add_argument("--alliance-graph", choices=("parties", "random"), default="parties")
+    parser.add_argument("--json", help="write the reports into this file")
+    args = parser.parse_args()
+
+    reports = []
+    for players in args.players:
+        report = run_scenario(players, args.party_size, args.alliance_graph)
+        print_report(report)
+        reports.append(report)
+
+    if args.json:
+        with open(args.json, "w") as report_file:
+            json.dump(reports, report_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
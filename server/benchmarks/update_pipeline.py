@@ -0,0 +1,179 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from PodSixNet.rencode import dumps
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from json_loader import JsonLoader
+from logger import Logger
+from server_core import ClientState, ServerCore
+from stand_in_producer import StandInProducer
+
+"""Drive the server update pipeline with synthetic players' data and fake clients, headless
+Reports per-tick latency percentiles of every phase, bytes sent and optionally allocations
+Usage: python update_pipeline.py --players 50 200 1000 --ticks 200 [--json report.json]"""
+
+PHASES = ("load_player_data", "update_clients_awaiting_tes3mp_ip", "update_clients_allies_data",
+          "update_clients_having_update")
+
+
+# Client channel without a socket, counts what would have been sent
+class FakeClientChannel(ClientState):
+
+    def __init__(self, server):
+        ClientState.__init__(self)
+        self._server = server
+        self.bytes_sent = 0
+        self.messages_sent = 0
+
+    def Send(self, data):
+        outgoing = dumps(data) + b"\0---\0"
+        self.bytes_sent += len(outgoing)
+        self.messages_sent += 1
+        return len(outgoing)
+
+    def close(self):
+        pass
+
+    def buffered_bytes(self):
+        return 0
+
+
+def percentile(values: list, p: float):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def run_scenario(players: int, party_size: int, alliance_graph: str, churn: float, ticks: int, clients_ratio: float,
+                 wire_format: str, track_allocations: bool):
+    work_dir = tempfile.mkdtemp(prefix="alliedstats-benchmark-")
+    snapshot_path = os.path.join(work_dir, "alliesHealthBars.json")
+    with open(os.path.join(work_dir, "server_config.json"), "w") as config:
+        json.dump({"file_path": snapshot_path, "local_address": "127.0.0.1", "port": 0,
+                   "magicka_enabled": True, "fatigue_enabled": True}, config)
+
+    # JsonLoader reads server_config.json from the working directory
+    previous_dir = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        logger = Logger(os.path.join(work_dir, "benchmark"))
+        logger.configure({"level": "warning"})
+        json_loader = JsonLoader(logger)
+
+        producer = StandInProducer(players, party_size, seed=0, alliance_graph=alliance_graph)
+        producer.write_file(snapshot_path)
+        json_loader.load_player_data()
+
+        server = ServerCore(logger, json_loader)
+        clients = []
+        for i in range(int(players * clients_ratio)):
+            client = FakeClientChannel(server)
+            server.Connected(client, ("127.0.0.1", 50000 + i))
+            client.Network_receive_player_name({"player_name": "Player " + str(i), "delta_updates": True,
+                                                "wire_formats": [wire_format]})
+            clients.append(client)
+
+        # First update verifies the clients and sends them whole allies data, it is not measured
+        server.update_clients()
+        bytes_before = sum(client.bytes_sent for client in clients)
+        messages_before = sum(client.messages_sent for client in clients)
+
+        durations = {phase: [] for phase in PHASES}
+        totals = []
+        allocations = []
+        phase_calls = [json_loader.load_player_data, server.update_clients_awaiting_tes3mp_ip,
+                       server.update_clients_allies_data, server.update_clients_having_update]
+
+        if track_allocations:
+            tracemalloc.start()
+
+        for _ in range(ticks):
+            producer.tick(churn)
+            producer.write_file(snapshot_path)
+
+            if track_allocations:
+                tracemalloc.reset_peak()
+                traced_before = tracemalloc.get_traced_memory()[0]
+
+            tick_start = time.perf_counter()
+            for phase, call in zip(PHASES, phase_calls):
+                start = time.perf_counter()
+                call()
+                durations[phase].append(time.perf_counter() - start)
+            totals.append(time.perf_counter() - tick_start)
+
+            if track_allocations:
+                allocations.append(tracemalloc.get_traced_memory()[1] - traced_before)
+
+        if track_allocations:
+            tracemalloc.stop()
+
+        logger.close()
+    finally:
+        os.chdir(previous_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    def summarize(values: list):
+        return {"p50_ms": percentile(values, 50) * 1000, "p90_ms": percentile(values, 90) * 1000,
+                "p99_ms": percentile(values, 99) * 1000, "max_ms": max(values) * 1000}
+
+    report = {"players": players, "clients": len(clients), "party_size": party_size,
+              "alliance_graph": alliance_graph, "churn": churn, "ticks": ticks, "wire_format": wire_format,
+              "phases": {phase: summarize(durations[phase]) for phase in PHASES}, "tick": summarize(totals),
+              "bytes_sent_per_tick": (sum(client.bytes_sent for client in clients) - bytes_before) / ticks,
+              "messages_sent_per_tick": (sum(client.messages_sent for client in clients) - messages_before) / ticks}
+    if allocations:
+        report["peak_allocated_bytes_per_tick"] = {"p50": percentile(allocations, 50),
+                                                   "max": max(allocations)}
+    return report
+
+
+def print_report(report: dict):
+    print("{} players, {} clients, {} alliances of {}, churn {}, {} format, {} ticks".format(
+        report["players"], report["clients"], report["alliance_graph"], report["party_size"], report["churn"],
+        report["wire_format"], report["ticks"]))
+    print("  {:<36}{:>10}{:>10}{:>10}{:>10}".format("phase", "p50 ms", "p90 ms", "p99 ms", "max ms"))
+    for phase, summary in list(report["phases"].items()) + [("tick", report["tick"])]:
+        print("  {:<36}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.3f}".format(phase, summary["p50_ms"], summary["p90_ms"],
+                                                                    summary["p99_ms"], summary["max_ms"]))
+    print("  bytes sent per tick: {:.0f}, messages sent per tick: {:.1f}".format(report["bytes_sent_per_tick"],
+                                                                                report["messages_sent_per_tick"]))
+    if "peak_allocated_bytes_per_tick" in report:
+        print("  peak allocated bytes per tick: p50 {p50}, max {max}".format(**report["peak_allocated_bytes_per_tick"]))
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the server update pipeline with synthetic load")
+    parser.add_argument("--players", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--party-size", type=int, default=4)
+    parser.add_argument("--alliance-graph", choices=("parties", "random"), default="parties")
+    parser.add_argument("--churn", type=float, default=0.25, help="portion of players changing stats every tick")
+    parser.add_argument("--ticks", type=int, default=200)
+    parser.add_argument("--clients-ratio", type=float, default=1.0, help="portion of players running the client")
+    parser.add_argument("--wire-format", choices=("binary", "dict"), default="binary")
+    parser.add_argument("--allocations", action="store_true", help="track allocations, slows the pipeline down")
+    parser.add_argument("--json", help="write the reports into this file")
+    args = parser.parse_args()
+
+    reports = []
+    for players in args.players:
+        report = run_scenario(players, args.party_size, args.alliance_graph, args.churn, args.ticks,
+                              args.clients_ratio, args.wire_format, args.allocations)
+        print_report(report)
+        reports.append(report)
+
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(reports, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
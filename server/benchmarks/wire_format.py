@@ -0,0 +1,69 @@
+import os
+import random
+import sys
+import timeit
+
+from PodSixNet.rencode import dumps, loads
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from stats_codec import STAT_FIELDS, AllyStats, pack_allies, unpack_allies
+
+"""Compare message size and encode/decode throughput of the dict and binary wire formats
+Usage: python wire_format.py [allies count]"""
+
+
+def generate_allies_data(allies_count: int):
+    allies_data = dict()
+    for i in range(allies_count):
+        allies_data["Player Name " + str(i)] = {"level": random.randint(1, 80),
+                                                "baseHealth": 250.0, "currentHealth": random.uniform(0, 250),
+                                                "baseMagicka": 180.0, "currentMagicka": random.uniform(0, 180),
+                                                "baseFatigue": 300.0, "currentFatigue": random.uniform(0, 300)}
+    return allies_data
+
+
+def measure(name: str, message: dict, number: int = 20000):
+    encoded = dumps(message)
+    encode_time = timeit.timeit(lambda: dumps(message), number=number)
+    decode_time = timeit.timeit(lambda: loads(encoded), number=number)
+    print("{:<28}{:>8} B{:>14.0f} msg/s{:>14.0f} msg/s".format(name, len(encoded), number / encode_time,
+                                                               number / decode_time))
+
+
+def measure_binary(name: str, ally_ids: dict, allies_data: dict, names: dict, number: int = 20000):
+    def encode():
+        return dumps({"action": "receive_allies_packed", "names": names, "records": pack_allies(ally_ids, allies_data),
+                      "removed": []})
+
+    def decode():
+        unpack_allies(loads(encoded)["records"])
+
+    encoded = encode()
+    encode_time = timeit.timeit(encode, number=number)
+    decode_time = timeit.timeit(decode, number=number)
+    print("{:<28}{:>8} B{:>14.0f} msg/s{:>14.0f} msg/s".format(name, len(encoded), number / encode_time,
+                                                               number / decode_time))
+
+
+def main(allies_count: int):
+    random.seed(0)
+    allies_data = generate_allies_data(allies_count)
+    allies_records = {ally_name: AllyStats.from_dict(stats) for ally_name, stats in allies_data.items()}
+    ally_ids = {ally_name: i for i, ally_name in enumerate(allies_data)}
+    changed_ally = next(iter(allies_data))
+
+    print("{} allies, {} stat fields each".format(allies_count, len(STAT_FIELDS)))
+    print("{:<28}{:>10}{:>20}{:>20}".format("format", "size", "encode", "decode"))
+
+    measure("dict, full", {"action": "receive_allies_data", "allies_data": allies_data})
+    measure("dict, one field delta", {"action": "receive_allies_delta",
+                                      "changed": {changed_ally: {"currentFatigue": 12.5}}, "removed": []})
+    measure_binary("binary, full with names", ally_ids, allies_records,
+                   {ally_id: ally_name for ally_name, ally_id in ally_ids.items()})
+    measure_binary("binary, full", ally_ids, allies_records, {})
+    measure_binary("binary, one ally delta", ally_ids, {changed_ally: allies_records[changed_ally]}, {})
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 8)
@@ -0,0 +1,80 @@
+from stats_codec import AllyStats, pack_ally
+
+"""Allies' stats encoded once per AllyStats record and shared by the messages of every client having the ally
+Encodings are kept along with the record they were made from and only reused for that very record
+Records of unchanged stats are carried over between snapshots, see json_loader.JsonLoader, changed stats
+are a new record and so are encoded again the first time they are sent"""
+
+
+class EncodedAllies:
+
+    def __init__(self):
+        # Ally name -> (AllyStats, base64 record) for binary messages, see stats_codec.pack_ally
+        self._records = dict()
+        # Ally name -> (AllyStats, stats dict) for dict messages and allies new to delta clients
+        self._stats_dicts = dict()
+        # Ally name -> (AllyStats, old AllyStats, changed fields) for delta messages
+        self._changed_fields = dict()
+
+        # Generation of the snapshot the entries have last been pruned for
+        self._generation = None
+
+        # Allies encoded and encodings reused since the start, reported in the sources stats
+        self._encoded_count = 0
+        self._reused_count = 0
+
+    # Drop entries of allies missing in the snapshot, does nothing until a new snapshot is swapped in
+    def prune(self, generation: int, ally_names):
+        if generation == self._generation:
+            return
+        self._generation = generation
+
+        for entries in (self._records, self._stats_dicts, self._changed_fields):
+            for ally_name in [ally_name for ally_name in entries if ally_name not in ally_names]:
+                del entries[ally_name]
+
+    # Get base64 record of the ally's stats
+    def get_record(self, ally_name: str, ally_id: int, stats: AllyStats):
+        entry = self._records.get(ally_name)
+        if entry is not None and entry[0] is stats:
+            self._reused_count += 1
+            return entry[1]
+
+        record = pack_ally(ally_id, stats)
+        self._store(self._records, ally_name, (stats, record))
+        return record
+
+    # Get stats dict of the ally, the dict is shared by all messages and must not be modified
+    def get_stats_dict(self, ally_name: str, stats: AllyStats):
+        entry = self._stats_dicts.get(ally_name)
+        if entry is not None and entry[0] is stats:
+            self._reused_count += 1
+            return entry[1]
+
+        stats_dict = stats.to_dict()
+        self._store(self._stats_dicts, ally_name, (stats, stats_dict))
+        return stats_dict
+
+    # Get fields of the ally's stats differing from the old stats the client has been sent
+    # Watchers of an ally usually hold the same old record, so they share one result
+    def get_changed_fields(self, ally_name: str, stats: AllyStats, old_stats: AllyStats):
+        entry = self._changed_fields.get(ally_name)
+        if entry is not None and entry[0] is stats and entry[1] is old_stats:
+            self._reused_count += 1
+            return entry[2]
+
+        changed_fields = stats.get_changed_fields(old_stats)
+        self._store(self._changed_fields, ally_name, (stats, old_stats, changed_fields))
+        return changed_fields
+
+    def _store(self, entries: dict, ally_name: str, entry: tuple):
+        self._encoded_count += 1
+        entries[ally_name] = entry
+
+    @property
+    def encoded_count(self):
+        return self._encoded_count
+
+    @property
+    def reused_count(self):
+        return self._reused_count
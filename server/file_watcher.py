@@ -0,0 +1,137 @@
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+import threading
+
+from logger import Logger, WARNING
+from wakeup import Wakeup
+
+"""Watchers notify the server loop about changes of the allies snapshot file through a wakeup file descriptor"""
+
+# Linux inotify constants, see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# struct inotify_event {int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[];}
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class InotifyFileWatcher:
+
+    def __init__(self, file_path: str):
+        self._directory, self._file_name = os.path.split(os.path.abspath(file_path))
+        self._file_name = os.fsencode(self._file_name)
+
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        # Watch the directory rather than the file itself so the watch survives the file being replaced
+        # Only react to finished writes and renames, partially written files are of no interest
+        watch = self._libc.inotify_add_watch(self._fd, os.fsencode(self._directory), IN_CLOSE_WRITE | IN_MOVED_TO)
+        if watch < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, "inotify_add_watch failed for " + self._directory)
+
+    def fileno(self):
+        return self._fd
+
+    # Drain pending events, return True if any of them concerned the watched file
+    def consume(self):
+        changed = False
+        while True:
+            try:
+                buffer = os.read(self._fd, 4096)
+            except BlockingIOError:
+                return changed
+
+            offset = 0
+            while offset < len(buffer):
+                _, _, _, name_length = INOTIFY_EVENT.unpack_from(buffer, offset)
+                offset += INOTIFY_EVENT.size
+                name = buffer[offset:offset + name_length].rstrip(b"\0")
+                offset += name_length
+                if name == self._file_name:
+                    changed = True
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingFileWatcher:
+
+    def __init__(self, file_path: str, min_interval: float, max_interval: float):
+        self._file_path = file_path
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+
+        self._wakeup = Wakeup()
+
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._poll, name="file-watcher", daemon=True)
+        self._thread.start()
+
+    def fileno(self):
+        return self._wakeup.fileno()
+
+    # Return True if the polling thread has seen a change since the last call
+    def consume(self):
+        return self._wakeup.drain()
+
+    def close(self):
+        self._closed.set()
+        self._thread.join()
+        self._wakeup.close()
+
+    # Stat the file, poll again sooner after a change and back off while the file stays untouched
+    def _poll(self):
+        interval = self._min_interval
+        last_signature = self._get_signature()
+
+        while not self._closed.wait(interval):
+            signature = self._get_signature()
+
+            if signature == last_signature:
+                interval = min(interval * 2, self._max_interval)
+                continue
+
+            last_signature = signature
+            interval = self._min_interval
+            self._wakeup.notify()
+
+    def _get_signature(self):
+        try:
+            file_stat = os.stat(self._file_path)
+        except OSError:
+            return None
+        return file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino
+
+
+# Create watcher according to the mode from config: "inotify", "polling" or "auto"
+# "auto" uses inotify where available and falls back to polling otherwise
+def create_file_watcher(file_path: str, logger: Logger, mode: str = "auto", min_interval: float = 0.01,
+                        max_interval: float = 0.5):
+    if mode != "polling" and sys.platform.startswith("linux"):
+        try:
+            watcher = InotifyFileWatcher(file_path)
+            logger.append("Watching " + file_path + " using inotify")
+            return watcher
+        except (OSError, AttributeError) as e:
+            if mode == "inotify":
+                raise
+            logger.append("inotify is unavailable (" + str(e) + "), falling back to polling", WARNING)
+
+    logger.append("Watching " + file_path + " by polling")
+    return PollingFileWatcher(file_path, min_interval, max_interval)
+
+
+# Create watcher of the file with settings from server config
+def create_file_watcher_from_config(config: dict, logger: Logger, file_path: str):
+    return create_file_watcher(file_path, logger, config.get("file_watcher", "auto"),
+                               config.get("poll_interval_min", 0.01), config.get("poll_interval_max", 0.5))
@@ -0,0 +1,143 @@
+import ipaddress
+import json
+import socketserver
+import threading
+
+from logger import Logger, ERROR, WARNING
+from metrics import Metrics
+from wakeup import Wakeup
+
+"""Local socket endpoint accepting players' data pushed as newline-delimited JSON records
+
+Each line is one record:
+    {"type": "player", "name": "<account name>", "ip": "<ip>", "alliesData": {...}}
+    {"type": "commit", "session": <producer start time>, "sequence": <n>, "timestamp": <time>, "source": "<name>"}
+Player records are collected until a commit record publishes them as a new snapshot,
+the same players' data the Lua script otherwise writes into alliesHealthBars.json
+Session, sequence and timestamp of the commit record are optional, so is the source unless there are more sources
+in server config, see json_loader.py
+Snapshots are built on the handler threads, the server loop only swaps them in like those of snapshot readers"""
+
+
+class IngestRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        snapshot = dict()
+
+        for line in self.rfile:
+            try:
+                record = json.loads(line)
+                record_type = record["type"]
+
+                if record_type == "player":
+                    snapshot[record["name"]] = {"ip": record["ip"], "alliesData": record["alliesData"]}
+                elif record_type == "commit":
+                    self.server.ingest.publish(snapshot, record.get("session"), record.get("sequence"),
+                                               record.get("timestamp"), record.get("source"))
+                    snapshot = dict()
+            except (ValueError, KeyError, TypeError):
+                self.server.ingest.logger.append("Ignoring malformed ingest record: " + repr(line[:200]), WARNING,
+                                                 "malformed_ingest_record")
+
+
+class IngestTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, "UnixStreamServer"):
+    class IngestUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+
+class IngestServer:
+
+    def __init__(self, logger: Logger, sources: list, metrics: Metrics, address: str = "127.0.0.1", port: int = 8001,
+                 unix_path: str = None):
+        self.logger = logger
+        self._sources = sources
+        self._sources_by_name = {source.name: source for source in sources}
+        self._metrics = metrics
+
+        # Source -> latest snapshot built of the source's pushed players' data, not yet taken by the server loop
+        self._snapshots = dict()
+        self._lock = threading.Lock()
+
+        # Handler threads build one snapshot at a time, so building is timed as one phase
+        self._build_lock = threading.Lock()
+
+        # Wakes the server loop up once a snapshot has been committed
+        self._wakeup = Wakeup()
+
+        if unix_path:
+            self._server = IngestUnixServer(unix_path, IngestRequestHandler)
+            self.logger.append("Accepting players' data on " + unix_path)
+        else:
+            self._server = IngestTCPServer((address, port), IngestRequestHandler)
+            self.logger.append("Accepting players' data on " + address + ":" + str(port))
+        self._server.ingest = self
+
+        self._thread = threading.Thread(target=self._server.serve_forever, name="ingest-server", daemon=True)
+        self._thread.start()
+
+    def fileno(self):
+        return self._wakeup.fileno()
+
+    # Called from handler threads, build snapshot of the committed players' data of the source (the first one
+    # if not given), a newer snapshot replaces one of the same source the server loop has not taken yet
+    def publish(self, player_data: dict, session: int = None, sequence: int = None, timestamp: float = None,
+                source_name: str = None):
+        source = self._sources[0] if source_name is None else self._sources_by_name.get(source_name)
+        if source is None:
+            self.logger.append("Ignoring snapshot pushed for unknown source " + str(source_name), WARNING,
+                               "unknown_source")
+            return
+
+        with self._build_lock, self._metrics.timer("build_pushed_snapshot"):
+            snapshot = source.json_loader.build_snapshot(player_data, session, sequence, timestamp)
+        if snapshot is None:
+            return
+
+        # Changes of both are carried over, the data is that of the later generation
+        with self._lock:
+            pending = self._snapshots.get(source)
+            if pending is not None:
+                snapshot = pending.merge_changes(snapshot) if snapshot.generation > pending.generation \
+                    else snapshot.merge_changes(pending)
+            self._snapshots[source] = snapshot
+        self._wakeup.notify()
+
+    # Return the latest snapshot built of every source as a dictionary of SnapshotSource -> json_loader.Snapshot,
+    # empty if there has been no commit since the last call
+    def consume(self):
+        self._wakeup.drain()
+
+        with self._lock:
+            snapshots = self._snapshots
+            self._snapshots = dict()
+        return snapshots
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._wakeup.close()
+
+
+def is_loopback_address(address: str):
+    try:
+        return ipaddress.ip_address(address).is_loopback
+    except ValueError:
+        return address == "localhost"
+
+
+# Create ingest server from server config, the endpoint is local only
+# Pushed players' data decides the impersonation check, so the endpoint is never bound to other than loopback
+def create_ingest_server_from_config(config: dict, logger: Logger, sources: list, metrics: Metrics):
+    address = config.get("ingest_address", "127.0.0.1")
+    if not is_loopback_address(address):
+        logger.append("ingest_address " + str(address) + " is not a loopback address, accepting players' data on " +
+                      "127.0.0.1 instead", ERROR)
+        address = "127.0.0.1"
+
+    return IngestServer(logger, sources, metrics, address, config.get("ingest_port", 8001),
+                        config.get("ingest_unix_path"))
@@ -1,53 +1,322 @@
 import json
+import os
+import re
 import sys
+import threading
 from json import JSONDecodeError
 
-from logger import Logger
+from logger import Logger, ERROR, WARNING
+from player_index import PlayerIndex
+from stats_codec import AllyStats, STAT_FIELDS, is_valid_stats
+
+# Header the Lua script writes at the very beginning of a stamped snapshot
+SNAPSHOT_HEADER = re.compile(rb'\{\s*"sequence"\s*:\s*(\d+)\s*,\s*"session"\s*:\s*(\d+)')
+
+
+# Fully built players' data snapshot, never modified once created so it can be handed between threads
+class Snapshot:
+
+    def __init__(self, player_data: dict, generation: int, sequence: int = None, timestamp: float = None,
+                 changed_players: set = frozenset(), player_versions: dict = None, ally_names: set = frozenset()):
+        self._player_data = player_data
+        self._generation = generation
+        self._sequence = sequence
+        self._timestamp = timestamp
+        # Names of players whose allies data differs from the previous snapshot
+        self._changed_players = changed_players
+        # Player name -> generation the player's allies data has last changed in, stats of allies carry
+        # versions of their own, clients remember the versions they have been sent so finding changes
+        # is comparing integers
+        self._player_versions = player_versions if player_versions is not None else dict()
+        # Names of allies of any player
+        self._ally_names = ally_names
+
+    # Snapshot replacing this one before the server loop took it, the changes of both are merged
+    def merge_changes(self, newer):
+        return Snapshot(newer.player_data, newer.generation, newer.sequence, newer.timestamp,
+                        self._changed_players | newer.changed_players, newer.player_versions, newer.ally_names)
+
+    @property
+    def player_data(self):
+        return self._player_data
+
+    @property
+    def generation(self):
+        return self._generation
+
+    @property
+    def sequence(self):
+        return self._sequence
+
+    @property
+    def timestamp(self):
+        return self._timestamp
+
+    @property
+    def changed_players(self):
+        return self._changed_players
+
+    @property
+    def player_versions(self):
+        return self._player_versions
+
+    @property
+    def ally_names(self):
+        return self._ally_names
 
 
 class JsonLoader:
 
-    def __init__(self, logger: Logger):
+    # Loader of the first source from "sources" in server config loads the config itself,
+    # loaders of further sources share its config, see get_sources_config
+    def __init__(self, logger: Logger, config: dict = None, source: dict = None):
         self._logger = logger
-        self.config = self._get_config()
-        self._player_data = None
+        self.config = config if config is not None else self._get_config()
+        self._source = source if source is not None else self.get_sources_config()[0]
+
+        # Snapshot the server loop works with, replaced as a whole by swap_snapshot
+        self._snapshot = None
+        # Players changed by the snapshots swapped in since take_changed_players has last been called
+        self._changed_players = set()
+
+        # Snapshots are built either by the server loop or by a SnapshotReader thread, see snapshot_reader.py
+        # State below belongs to the building side and is guarded by the lock
+        self._lock = threading.Lock()
+
+        # Last built snapshot, the new ones are compared against it
+        self._latest_snapshot = None
+
+        # Alliances of the last built snapshot, used to find the players affected by a change
+        self._player_index = PlayerIndex()
+
+        # (ally name, stats values) -> AllyStats record of the last built snapshot
+        # Records with unchanged stats are carried over into the next snapshot along with their versions
+        self._records = dict()
+        # Version of the last created record, each distinct record gets a new one
+        self._record_version = 0
+
+        # Size, modification time and inode of the last parsed snapshot file
+        self._file_signature = None
+
+        # Producer session and sequence number of the last accepted stamped snapshot
+        self._session = None
+        self._sequence = None
+        # Snapshots the producer has written but the server never saw
+        self._missed_snapshots = 0
 
     def get_player_data_by_name(self, player_name: str):
-        if player_name in self._player_data:
-            return self._player_data[player_name]
+        player_data = self.player_data
+        if player_data is not None and player_name in player_data:
+            return player_data[player_name]
         return None
 
+    # Get version of the player's allies data, None if the player is not in the current snapshot
+    def get_player_version(self, player_name: str):
+        if self._snapshot is None:
+            return None
+        return self._snapshot.player_versions.get(player_name)
+
+    # Get names of allies in the current snapshot
+    def get_ally_names(self):
+        if self._snapshot is None:
+            return frozenset()
+        return self._snapshot.ally_names
+
     def get_tes3mp_ip_by_name(self, player_name: str):
-        if player_name in self._player_data:
-            return self._player_data[player_name]["ip"]
+        player_data = self.player_data
+        if player_data is not None and player_name in player_data:
+            return player_data[player_name]["ip"]
         return None
 
+    # Load players' data on startup, a file that does not exist is a config error of a single source
+    # Return True if a snapshot has been loaded, a file which could not be parsed yet is left to the reader
+    def load_initial_player_data(self):
+        if self.load_player_data():
+            return True
+
+        file_path = self._get_file_path()
+        if self._file_signature is not None or (file_path is not None and os.path.isfile(file_path)):
+            return False
+
+        # One of several TES3MP servers might not have run yet, its watcher picks the file up once written
+        if file_path is not None and len(self.get_sources_config()) > 1:
+            self._logger.append("File " + file_path + " of source " + self.name + " does not exist, the source " +
+                                "has no players until it is written", WARNING)
+            return False
+
+        self._exit_on_missing_file()
+        return False
+
+    # Read and swap in a new snapshot on the calling thread
+    # Return True if a snapshot with new content has been loaded
     def load_player_data(self):
+        snapshot = self.read_snapshot()
+        if snapshot is None:
+            return False
+
+        return self.swap_snapshot(snapshot)
+
+    # Make the snapshot the one the server loop works with, return False if it is not newer than the current one
+    # With both a reader and the ingest socket a snapshot can be built before another one but swapped in after it
+    # Changed players of an older snapshot are still taken, the newer one has only been compared against it
+    def swap_snapshot(self, snapshot: Snapshot):
+        self._changed_players.update(snapshot.changed_players)
+        if self._snapshot is not None and snapshot.generation <= self._snapshot.generation:
+            return False
+
+        self._snapshot = snapshot
+        return True
+
+    # Get names of players whose allies data has changed since the last call
+    def take_changed_players(self):
+        changed_players = self._changed_players
+        self._changed_players = set()
+        return changed_players
+
+    # Reload the .json only if its size, modification time or inode differ from the last parsed one
+    # Stamped snapshots whose sequence number has already been seen are not parsed at all
+    # Return a new snapshot or None if the file has not been changed or its content is the same
+    def read_snapshot(self):
+        try:
+            file_stat = os.stat(self._get_file_path())
+            file_signature = (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino)
+
+            if file_signature == self._file_signature:
+                return None
+
+            with open(self._get_file_path(), "rb") as data:
+                content = data.read()
+        except Exception as e:
+            # On Windows the producer has to remove the old snapshot before renaming the new one in its place
+            # and the file may be locked while being replaced, a missing file is only checked on startup
+            # by load_initial_player_data as this runs on reader threads too
+            if not isinstance(e, FileNotFoundError):
+                self._logger.append("Reading " + self._get_file_path() + " failed: " + str(e), WARNING,
+                                    "snapshot_read_error")
+            return None
+
+        header = SNAPSHOT_HEADER.match(content)
+        if header is not None:
+            with self._lock:
+                is_new_sequence = self._is_new_sequence(int(header.group(2)), int(header.group(1)))
+            if not is_new_sequence:
+                self._file_signature = file_signature
+                return None
 
         # Try loading the .json with player names and allies data for each of the player"s allies
         try:
-            with open(self._get_file_path()) as data:
-                try:
-                    new_data = json.load(data)
-                    old_data = self._player_data
+            new_data = json.loads(content)
+        except (JSONDecodeError, UnicodeDecodeError):
+            self._logger.append("JSONDecodeError: Decoding failed as the file is probably being worked with" +
+                                "-the process of tes3mp lua updating .json file - this is expected behaviour and " +
+                                "nothing to be worry about", WARNING, "json_decode_error")
+            return None
 
-                    if isinstance(new_data, list):
-                        new_data = dict(new_data)
+        # Only remember the signature of fully parsed files so a torn read is retried
+        self._file_signature = file_signature
 
-                    if new_data != old_data:
-                        self._player_data = new_data
-                        return
-                except JSONDecodeError:
-                    print("JSONDecodeError: Decoding failed as the file is probably being worked with" +
-                          "-the process of tes3mp lua updating .json file - this is expected behaviour and " +
-                          "nothing to be worry about")
+        if header is None:
+            return self.build_snapshot(new_data)
+        return self.build_snapshot(new_data.get("players"), int(header.group(2)), int(header.group(1)),
+                                   new_data.get("timestamp"))
 
+    # Validate players' data and build a snapshot of it unless it is stale or the same as the last one
+    def build_snapshot(self, new_data, session: int = None, sequence: int = None, timestamp: float = None):
+        with self._lock:
+            stamped = session is not None and sequence is not None
+            if stamped:
+                if not self._is_new_sequence(session, sequence):
+                    return None
+                self._accept_sequence(session, sequence)
 
-        except Exception:
-            self._logger.append("Opening .json file failed. Make sure the path provided in your config directs" +
-                                " to the absolute path of the alliesHealthBars.json file located in " +
-                                "server/data/ by default.")
-            sys.exit()
+            # Records are carried over from the last built snapshot, so validating is part of building
+            new_data = self._validate_player_data(new_data)
+
+            latest = self._latest_snapshot
+            generation = latest.generation + 1 if latest is not None else 1
+            changed_players = frozenset(self._player_index.rebuild(new_data, generation))
+
+            # Allies data is compared by the player index, only players joining, leaving or changing ip remain
+            if latest is not None and not changed_players and self._has_same_players(latest.player_data, new_data):
+                return None
+
+            self._latest_snapshot = Snapshot(new_data, generation, sequence if stamped else None, timestamp,
+                                             changed_players, self._player_index.player_versions,
+                                             self._player_index.ally_names)
+            return self._latest_snapshot
+
+    def _has_same_players(self, old_data: dict, new_data: dict):
+        if old_data.keys() != new_data.keys():
+            return False
+        return all(data["ip"] == old_data[player_name]["ip"] for player_name, data in new_data.items())
+
+    # Get players' data with the structure the rest of the server expects, malformed players are left out
+    # as are players with stats not fitting the binary wire format, see stats_codec.is_valid_stats
+    # Stats of every ally become AllyStats records, players having the same stats of an ally share one record
+    # Players may have been written different stats of the same ally, each distinct copy is a record of its own
+    # Lua writes empty tables as lists, so players without allies have an empty list as their allies data
+    def _validate_player_data(self, new_data):
+        if isinstance(new_data, list):
+            new_data = dict(new_data)
+        if not isinstance(new_data, dict):
+            self._logger.append("Ignoring players' data of source " + self.name + ", it is not an object", WARNING,
+                                "invalid_player_data")
+            return dict()
+
+        player_data = dict()
+        # (ally name, stats values) -> record
+        records = dict()
+        for player_name, data in new_data.items():
+            allies_data = data.get("alliesData") if isinstance(data, dict) else None
+            if allies_data == []:
+                allies_data = dict()
+
+            try:
+                if not isinstance(data.get("ip"), str):
+                    raise TypeError("ip is not a string")
+
+                allies_records = dict()
+                for ally_name, stats in allies_data.items():
+                    key = (ally_name,) + tuple(stats[field] for field in STAT_FIELDS)
+                    record = records.get(key)
+                    if record is None:
+                        record = self._records.get(key)
+                        if record is None:
+                            if not is_valid_stats(key[1:]):
+                                raise TypeError("invalid stats of ally " + str(ally_name))
+                            self._record_version += 1
+                            record = AllyStats(*key[1:], version=self._record_version)
+                        records[key] = record
+                    allies_records[ally_name] = record
+            except (AttributeError, KeyError, TypeError):
+                self._logger.append("Ignoring malformed data of player " + str(player_name) + " of source " +
+                                    self.name, WARNING, "invalid_player_data")
+                continue
+
+            player_data[player_name] = {"ip": data["ip"], "alliesData": allies_records}
+
+        self._records = records
+        return player_data
+
+    # A restarted producer starts a new session with sequence numbers from the beginning
+    def _is_new_sequence(self, session: int, sequence: int):
+        return session != self._session or sequence > self._sequence
+
+    def _accept_sequence(self, session: int, sequence: int):
+        if session == self._session and sequence > self._sequence + 1:
+            missed = sequence - self._sequence - 1
+            self._missed_snapshots += missed
+            self._logger.append("Missed " + str(missed) + " snapshot(s) before snapshot " + str(sequence) +
+                                " of source " + self.name, WARNING, "missed_snapshots")
+
+        self._session = session
+        self._sequence = sequence
+
+    def _exit_on_missing_file(self):
+        self._logger.append("Opening .json file failed. Make sure the path provided in your config directs" +
+                            " to the absolute path of the alliesHealthBars.json file located in " +
+                            "server/data/ by default.", ERROR)
+        sys.exit()
 
     # Get server config
     def _get_config(self):
@@ -56,11 +325,52 @@ class JsonLoader:
                 return json.load(config)
         except Exception:
             self._logger.append(
-                "Server config could not be loaded. Make sure there is server_config.json file in your directory.")
+                "Server config could not be loaded. Make sure there is server_config.json file in your directory.",
+                ERROR)
 
     # Get absolute file path of the .json containing player names and related health data
     def _get_file_path(self):
-        return self.config["file_path"]
+        return self._source.get("file_path")
+
+    # Get snapshot sources, each one is a TES3MP server with its own players
+    # Without "sources" in server config there is a single source named "default" reading file_path
+    def get_sources_config(self):
+        sources = self.config.get("sources")
+        if sources:
+            return sources
+        return [{"name": "default", "file_path": self.config.get("file_path")}]
 
     def get_stats_settings(self):
         return {"magicka_enabled": self.config["magicka_enabled"], "fatigue_enabled": self.config["fatigue_enabled"]}
+
+    @property
+    def name(self):
+        return self._source["name"]
+
+    @property
+    def file_path(self):
+        return self._get_file_path()
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    @property
+    def generation(self):
+        return self._snapshot.generation if self._snapshot is not None else 0
+
+    @property
+    def player_data(self):
+        return self._snapshot.player_data if self._snapshot is not None else None
+
+    @property
+    def sequence(self):
+        return self._sequence
+
+    @property
+    def snapshot_timestamp(self):
+        return self._snapshot.timestamp if self._snapshot is not None else None
+
+    @property
+    def missed_snapshots(self):
+        return self._missed_snapshots
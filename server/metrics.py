@@ -0,0 +1,181 @@
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from logger import Logger, WARNING
+
+"""Counters and latency histograms of the server loop, exposed over localhost HTTP or dumped into a file"""
+
+
+# Latency histogram with power of two microsecond buckets, observing is a few integer operations
+class Histogram:
+    buckets_count = 24
+
+    def __init__(self):
+        # Bucket i counts durations below 2 ** i microseconds, the last one everything longer
+        self._buckets = [0] * self.buckets_count
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+
+    def observe(self, seconds: float):
+        bucket = min(int(seconds * 1000000).bit_length(), self.buckets_count - 1)
+        self._buckets[bucket] += 1
+        self._count += 1
+        self._sum += seconds
+        if seconds > self._max:
+            self._max = seconds
+
+    # Upper bound of the bucket holding the given percentile, in milliseconds
+    def _percentile(self, buckets: list, count: int, p: float):
+        threshold = count * p / 100
+        seen = 0
+        for i, bucket_count in enumerate(buckets):
+            seen += bucket_count
+            if seen >= threshold:
+                return (2 ** i) / 1000
+        return self._max * 1000
+
+    def to_dict(self):
+        buckets = list(self._buckets)
+        count = sum(buckets)
+        if count == 0:
+            return {"count": 0}
+        return {"count": count, "mean_ms": self._sum / self._count * 1000, "max_ms": self._max * 1000,
+                "p50_ms": self._percentile(buckets, count, 50), "p90_ms": self._percentile(buckets, count, 90),
+                "p99_ms": self._percentile(buckets, count, 99)}
+
+
+class PhaseTimer:
+
+    def __init__(self, histogram: Histogram):
+        self._histogram = histogram
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._histogram.observe(time.perf_counter() - self._start)
+
+
+class Metrics:
+
+    def __init__(self):
+        self._started_at = time.time()
+        self._counters = dict()
+        self._histograms = dict()
+        self._timers = dict()
+        # Name -> callable returning the current value
+        self._gauges = dict()
+
+    def count(self, name: str, value: int = 1):
+        self._counters[name] = self._counters.get(name, 0) + value
+
+    # Time the block and record the duration into the phase's histogram
+    def timer(self, phase: str):
+        timer = self._timers.get(phase)
+        if timer is None:
+            self._histograms[phase] = Histogram()
+            timer = self._timers[phase] = PhaseTimer(self._histograms[phase])
+        return timer
+
+    def gauge(self, name: str, get_value):
+        self._gauges[name] = get_value
+
+    def to_dict(self):
+        return {"uptime_s": time.time() - self._started_at,
+                "counters": dict(self._counters),
+                "gauges": {name: get_value() for name, get_value in list(self._gauges.items())},
+                "phases": {phase: histogram.to_dict() for phase, histogram in list(self._histograms.items())}}
+
+
+class StatsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path not in ("/", "/stats"):
+            self.send_error(404)
+            return
+
+        try:
+            body = json.dumps(self.server.metrics.to_dict(), indent=2).encode("utf-8")
+        except Exception as e:
+            self.server.logger.append("Collecting stats failed: " + repr(e), WARNING, "stats_error")
+            self.send_error(500)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Requests are not logged
+    def log_message(self, format, *args):
+        pass
+
+
+# Serve metrics as JSON on localhost and/or dump them into a file periodically
+class StatsPublisher:
+
+    def __init__(self, metrics: Metrics, logger: Logger, port: int = None, dump_path: str = None,
+                 dump_interval: float = 10.0):
+        self._metrics = metrics
+        self._logger = logger
+        self._dump_path = dump_path
+        self._dump_interval = dump_interval
+        self._closed = threading.Event()
+        self._threads = []
+
+        if port:
+            # Bound to localhost only, the stats are not meant to be reachable from outside
+            self._http_server = ThreadingHTTPServer(("127.0.0.1", port), StatsRequestHandler)
+            self._http_server.daemon_threads = True
+            self._http_server.metrics = metrics
+            self._http_server.logger = logger
+            self._threads.append(threading.Thread(target=self._http_server.serve_forever, name="stats-http",
+                                                  daemon=True))
+            logger.append("Serving stats on http://127.0.0.1:" + str(port) + "/stats")
+        else:
+            self._http_server = None
+
+        if dump_path:
+            self._threads.append(threading.Thread(target=self._dump_periodically, name="stats-dump", daemon=True))
+            logger.append("Dumping stats into " + dump_path + " every " + str(dump_interval) + "s")
+
+        for thread in self._threads:
+            thread.start()
+
+    # A failed dump is logged and retried with the next one, the thread keeps running
+    def _dump_periodically(self):
+        while not self._closed.wait(self._dump_interval):
+            try:
+                self.dump()
+            except Exception as e:
+                self._logger.append("Dumping stats into " + self._dump_path + " failed: " + repr(e), WARNING,
+                                    "stats_dump_error")
+
+    # Replace the dump file in one step so readers never see a partial file
+    def dump(self):
+        temp_path = self._dump_path + ".tmp"
+        with open(temp_path, "w") as dump_file:
+            json.dump(self._metrics.to_dict(), dump_file, indent=2)
+        os.replace(temp_path, self._dump_path)
+
+    def close(self):
+        self._closed.set()
+        if self._http_server is not None:
+            self._http_server.shutdown()
+            self._http_server.server_close()
+
+
+# Create stats publisher from the "stats" section of server config, None if disabled
+def create_stats_publisher_from_config(config: dict, metrics: Metrics, logger: Logger):
+    settings = config.get("stats", {})
+    if not settings.get("enabled", False):
+        return None
+    return StatsPublisher(metrics, logger, settings.get("port"), settings.get("dump_path"),
+                          settings.get("dump_interval", 10.0))
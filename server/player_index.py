@@ -0,0 +1,50 @@
+# Alliances of the players' data snapshot, finds the players whose allies data has changed
+class PlayerIndex:
+
+    def __init__(self):
+        # Names of allies of any player
+        self._ally_names = frozenset()
+        # Player name -> fingerprint of the player's allies data as found in the last snapshot
+        # Records of unchanged stats are carried over between snapshots with their versions, see
+        # json_loader.JsonLoader, so the names of allies and versions of their records identify the data
+        self._fingerprints_by_player = dict()
+
+        # Player name -> version of the snapshot the player's allies data has last changed in
+        self._player_versions = dict()
+
+    # Rebuild the index from a new snapshot with the given version
+    # Return names of players whose allies data differs from the previous snapshot
+    def rebuild(self, player_data: dict, version: int = 0):
+        ally_names = set()
+        fingerprints_by_player = dict()
+        changed_players = set()
+
+        for player_name, data in player_data.items():
+            allies_data = data["alliesData"]
+            fingerprint = (tuple(allies_data), tuple(record.version for record in allies_data.values()))
+            fingerprints_by_player[player_name] = fingerprint
+
+            # Player is new, has gained or lost an ally or has been written different stats of an ally
+            # Every player's own copy of the stats is compared, nothing makes copies of the same ally agree
+            if self._fingerprints_by_player.get(player_name) != fingerprint:
+                changed_players.add(player_name)
+
+            ally_names.update(allies_data)
+
+        player_versions = {player_name: version if player_name in changed_players
+                           else self._player_versions[player_name] for player_name in fingerprints_by_player}
+
+        self._ally_names = ally_names
+        self._fingerprints_by_player = fingerprints_by_player
+        self._player_versions = player_versions
+
+        return changed_players
+
+    # Collections are replaced rather than modified by rebuild, so they can be kept by snapshots
+    @property
+    def player_versions(self):
+        return self._player_versions
+
+    @property
+    def ally_names(self):
+        return self._ally_names
@@ -0,0 +1,536 @@
+import time
+from weakref import WeakKeyDictionary
+
+from json_loader import JsonLoader
+from logger import Logger, ERROR, WARNING
+from metrics import Metrics
+from snapshot_source import create_snapshot_sources
+from stats_codec import negotiate_wire_format
+
+"""Transport independent part of the server shared by all server engines
+All methods starting with capital letter are network related"""
+
+
+# Client state and message handlers, mixed into the engine specific client channel
+# The channel is expected to provide Send(data), close(), buffered_bytes() and the _server attribute
+class ClientState:
+
+    def __init__(self):
+        self._ip = None
+        self._tes3mp_ip = None
+        self._awaiting_tes3mp_ip = True
+        # Snapshot source the client's player has been found in, see snapshot_source
+        self._source = None
+        self._player_name = None
+        self._allies_data = dict()
+        # Version of the player's allies data held in allies_data, see json_loader.Snapshot
+        self._allies_data_version = None
+        self._has_update = False
+
+        # Whether the client applies allies data deltas instead of replacing its allies data
+        self._delta_updates = False
+        # Allies data the client has been sent, deltas are computed against it
+        self._sent_allies_data = dict()
+        # Ally name -> version of the ally's stats the client has been sent
+        self._sent_ally_versions = dict()
+
+        # Either "binary" or "dict", see stats_codec
+        self._wire_format = "dict"
+        # Ids of allies whose names the client has been sent along with binary records
+        self._sent_ally_ids = set()
+
+        # Seconds between two allies data messages, zero unless the client has been found slow
+        self._send_interval = 0.0
+        # Monotonic time before which the client is not sent allies data
+        self._next_send_at = 0.0
+
+    def Network(self, data):
+        pass
+
+    def Network_receive_player_name(self, data):
+        self.player_name = data["player_name"]
+        self.delta_updates = data.get("delta_updates", False) is True
+        self.wire_format = negotiate_wire_format(data.get("wire_formats", ()))
+
+        self.server.logger.append("Received player name: " + self.player_name + " from client with ip " + self.ip)
+
+        if self.awaiting_tes3mp_ip:
+            self.server.add_client_awaiting_tes3mp_ip(self)
+
+    # Define explicit method for kicking
+    def Kick(self, message: str):
+        self.Close(message)
+
+    def Close(self, message: str = None):
+        # Let client know first
+        data = {"action": "disconnected"}
+        player = self.player_name
+
+        if not player:
+            player = self.ip
+
+        if message is not None:
+            data["message"] = message
+            self.server.logger.append("Player " + player + " has been kicked. Reason: " + message, WARNING)
+        else:
+            self.server.logger.append("Player " + player + " has disconnected.")
+
+        self.Send(data)
+
+        # Remove client entry and close the connection for them
+        self.server.Remove_client(self)
+        self.close()
+
+    @property
+    def player_name(self):
+        return self._player_name
+
+    @player_name.setter
+    def player_name(self, value):
+        self._player_name = value
+
+    @property
+    def ip(self):
+        return self._ip
+
+    @ip.setter
+    def ip(self, value):
+        self._ip = value
+
+    @property
+    def tes3mp_ip(self):
+        return self._tes3mp_ip
+
+    @tes3mp_ip.setter
+    def tes3mp_ip(self, value):
+        self._tes3mp_ip = value
+
+    @property
+    def awaiting_tes3mp_ip(self):
+        return self._awaiting_tes3mp_ip
+
+    @awaiting_tes3mp_ip.setter
+    def awaiting_tes3mp_ip(self, value):
+        self._awaiting_tes3mp_ip = value
+
+    @property
+    def source(self):
+        return self._source
+
+    @source.setter
+    def source(self, value):
+        self._source = value
+
+    @property
+    def allies_data(self):
+        return self._allies_data
+
+    @allies_data.setter
+    def allies_data(self, value):
+        self._allies_data = value
+
+    @property
+    def allies_data_version(self):
+        return self._allies_data_version
+
+    @allies_data_version.setter
+    def allies_data_version(self, value):
+        self._allies_data_version = value
+
+    @property
+    def has_update(self):
+        return self._has_update
+
+    @has_update.setter
+    def has_update(self, value):
+        self._has_update = value
+
+    @property
+    def delta_updates(self):
+        return self._delta_updates
+
+    @delta_updates.setter
+    def delta_updates(self, value):
+        self._delta_updates = value
+
+    @property
+    def sent_allies_data(self):
+        return self._sent_allies_data
+
+    @sent_allies_data.setter
+    def sent_allies_data(self, value):
+        self._sent_allies_data = value
+
+    @property
+    def sent_ally_versions(self):
+        return self._sent_ally_versions
+
+    @sent_ally_versions.setter
+    def sent_ally_versions(self, value):
+        self._sent_ally_versions = value
+
+    @property
+    def wire_format(self):
+        return self._wire_format
+
+    @wire_format.setter
+    def wire_format(self, value):
+        self._wire_format = value
+
+    @property
+    def sent_ally_ids(self):
+        return self._sent_ally_ids
+
+    @property
+    def send_interval(self):
+        return self._send_interval
+
+    @send_interval.setter
+    def send_interval(self, value):
+        self._send_interval = value
+
+    @property
+    def next_send_at(self):
+        return self._next_send_at
+
+    @next_send_at.setter
+    def next_send_at(self, value):
+        self._next_send_at = value
+
+    @property
+    def server(self):
+        return self._server
+
+
+
+# Verification of clients and fan-out of allies data
+class ServerCore:
+
+    def __init__(self, logger: Logger, json_loader: JsonLoader):
+        # Logger and JsonLoader that has loaded server config and will load the player"s allies data
+        # of the first snapshot source
+        self.logger = logger
+        self.json_loader = json_loader
+
+        # TES3MP servers whose players are served, each one with its own players and verified clients
+        self.sources = create_snapshot_sources(logger, json_loader)
+
+        self.stats_settings = self.json_loader.get_stats_settings()
+
+        # Clients, their ip addresses and player names go here
+        self.clients = WeakKeyDictionary()
+
+        # Clients which have sent their player name and wait for verification
+        self._clients_awaiting_tes3mp_ip = set()
+        # Verified clients which have not obtained allies data from the current snapshot yet
+        self._clients_awaiting_allies_data = set()
+        # Clients with allies data waiting to be sent
+        self._clients_having_update = set()
+
+        # Ally name -> small integer id used by the binary wire format, stable for the server's lifetime
+        self._ally_ids = dict()
+
+        # Clients with more unsent bytes than slow_client_buffer_bytes are sent allies data less often,
+        # their interval between messages doubles from slow_client_interval_min up to slow_client_interval_max
+        # Pending allies data is replaced by newer snapshots meanwhile, so only the latest values get sent
+        config = self.json_loader.config
+        self._slow_client_buffer_bytes = config.get("slow_client_buffer_bytes", 65536)
+        self._slow_client_interval_min = config.get("slow_client_interval_min", 0.1)
+        self._slow_client_interval_max = config.get("slow_client_interval_max", 2.0)
+        self._slow_clients = set()
+
+        # Timings of the loop phases, traffic and client counts
+        self.metrics = Metrics()
+        # Gauges are read by the stats threads, they only take lengths and counters the server loop keeps
+        self.metrics.gauge("clients", lambda: len(self.clients))
+        self.metrics.gauge("clients_awaiting_verification", lambda: len(self._clients_awaiting_tes3mp_ip))
+        self.metrics.gauge("verified_clients",
+                           lambda: sum(source.get_verified_clients_count() for source in self.sources))
+        self.metrics.gauge("slow_clients", lambda: len(self._slow_clients))
+        self.metrics.gauge("sources", self.get_sources_stats)
+
+    def Connected(self, client, address):
+        self.logger.append("New connection: " + str(client))
+        self.metrics.count("connections")
+        self.Add_client(client)
+        client.ip = address[0]
+
+        # Send additional stats data to client
+        self.Send_server_stats_settings(client)
+
+    def Add_client(self, client):
+        self.clients[client] = True
+
+    def Remove_client(self, client):
+        self.clients.pop(client, None)
+        self._clients_awaiting_tes3mp_ip.discard(client)
+        self._clients_awaiting_allies_data.discard(client)
+        self._clients_having_update.discard(client)
+        self._slow_clients.discard(client)
+
+        if client.source is not None:
+            client.source.remove_client(client)
+
+    # Send only changed allies and fields to clients supporting deltas, whole allies data to the rest
+    # Clients supporting the binary format receive whole records of the changed allies
+    # Allies are encoded once per version and shared by all clients, see encoded_allies
+    def Send_allies_data(self, client):
+        allies_data = client.allies_data
+
+        if client.wire_format == "binary":
+            changed, removed = self.get_allies_delta(client, allies_data, True)
+            if changed or removed:
+                self.Send(client, self.get_packed_allies_message(client, allies_data, changed, removed))
+        elif client.delta_updates:
+            changed, removed = self.get_allies_delta(client, allies_data, False)
+            if changed or removed:
+                data = {"action": "receive_allies_delta", "changed": changed, "removed": removed}
+                self.Send(client, data)
+        else:
+            encoded_allies = client.source.encoded_allies
+            data = {"action": "receive_allies_data",
+                    "allies_data": {ally_name: encoded_allies.get_stats_dict(ally_name, stats)
+                                    for ally_name, stats in allies_data.items()}}
+            self.Send(client, data)
+
+        # Snapshots are replaced on reload rather than modified so keeping the reference is safe
+        client.sent_allies_data = allies_data
+        client.has_update = False
+        self._clients_having_update.discard(client)
+
+    def Send_server_stats_settings(self, client):
+        data = {"action": "receive_server_stats_settings",
+                "magicka_enabled": self.stats_settings["magicka_enabled"],
+                "fatigue_enabled": self.stats_settings["fatigue_enabled"]}
+        self.Send(client, data)
+
+    # Send message to the client and account for the traffic
+    def Send(self, client, data: dict):
+        self.metrics.count("messages_sent")
+        self.metrics.count("bytes_sent", client.Send(data))
+
+    def get_ally_id(self, ally_name: str):
+        ally_id = self._ally_ids.get(ally_name)
+        if ally_id is None:
+            ally_id = self._ally_ids[ally_name] = len(self._ally_ids)
+        return ally_id
+
+    # Build binary message with whole records of changed allies, joined from records encoded once per AllyStats
+    # Names are only included for ids the client does not know yet
+    def get_packed_allies_message(self, client, allies_data: dict, changed: dict, removed: list):
+        encoded_allies = client.source.encoded_allies
+        records = []
+        names = dict()
+        for ally_name in changed:
+            ally_id = self.get_ally_id(ally_name)
+            if ally_id not in client.sent_ally_ids:
+                client.sent_ally_ids.add(ally_id)
+                names[ally_id] = ally_name
+            records.append(encoded_allies.get_record(ally_name, ally_id, allies_data[ally_name]))
+
+        return {"action": "receive_allies_packed", "names": names, "records": "".join(records),
+                "removed": [self.get_ally_id(ally_name) for ally_name in removed]}
+
+    # Get allies which are new or changed and names of removed allies, record the versions sent to the client
+    # Changed allies are found by versions of their records, with full_records they come as AllyStats,
+    # otherwise as stats dicts, known allies with their changed fields only
+    def get_allies_delta(self, client, new_data: dict, full_records: bool):
+        encoded_allies = client.source.encoded_allies
+        sent_ally_versions = client.sent_ally_versions
+        old_data = client.sent_allies_data
+        new_ally_versions = dict()
+
+        changed = dict()
+        for ally_name, stats in new_data.items():
+            version = new_ally_versions[ally_name] = stats.version
+            sent_version = sent_ally_versions.get(ally_name)
+            if sent_version is not None and sent_version == version:
+                continue
+
+            if full_records:
+                changed[ally_name] = stats
+            elif sent_version is None:
+                changed[ally_name] = encoded_allies.get_stats_dict(ally_name, stats)
+            else:
+                changed[ally_name] = encoded_allies.get_changed_fields(ally_name, stats, old_data[ally_name])
+
+        removed = [ally_name for ally_name in sent_ally_versions if ally_name not in new_data]
+        client.sent_ally_versions = new_ally_versions
+        return changed, removed
+
+    # Check whether the client may be sent allies data now, throttle it if its unsent data piles up
+    # The interval of a throttled client halves with every message sent while it keeps up
+    def ready_to_send(self, client, now: float):
+        if now < client.next_send_at:
+            return False
+
+        buffered = client.buffered_bytes()
+        if buffered > self._slow_client_buffer_bytes:
+            if client not in self._slow_clients:
+                self._slow_clients.add(client)
+                self.logger.append("Client of " + client.player_name + " is slow with " + str(buffered) +
+                                   " bytes unsent, sending allies data less often", WARNING, "slow_client")
+            self.metrics.count("sends_deferred")
+            client.send_interval = min(max(client.send_interval * 2, self._slow_client_interval_min),
+                                       self._slow_client_interval_max)
+            client.next_send_at = now + client.send_interval
+            return False
+
+        if client.send_interval:
+            client.send_interval /= 2
+            if client.send_interval < self._slow_client_interval_min:
+                client.send_interval = 0.0
+                self._slow_clients.discard(client)
+                self.logger.append("Client of " + client.player_name + " has caught up", key="slow_client_caught_up")
+            client.next_send_at = now + client.send_interval
+
+        return True
+
+    # Seconds until a throttled client may be sent its pending allies data, None if nothing is pending
+    def get_send_delay(self):
+        if not self._clients_having_update:
+            return None
+        next_send_at = min(client.next_send_at for client in self._clients_having_update)
+        return max(next_send_at - time.monotonic(), 0.0)
+
+    # Swap in snapshots built of players' data pushed over the ingest socket, see ingest_server.py
+    # Return True if any of them has been swapped in
+    def swap_pushed_snapshots(self, pushed: dict):
+        swapped = False
+        for source, snapshot in pushed.items():
+            if source.json_loader.swap_snapshot(snapshot):
+                swapped = True
+        return swapped
+
+    def get_sources_stats(self):
+        return {source.name: {"snapshot_generation": source.json_loader.generation,
+                              "snapshot_sequence": source.json_loader.sequence,
+                              "missed_snapshots": source.json_loader.missed_snapshots,
+                              "verified_clients": source.get_verified_clients_count(),
+                              "encoded_allies": source.encoded_allies.encoded_count,
+                              "reused_allies": source.encoded_allies.reused_count} for source in self.sources}
+
+    def has_name(self, client):
+        return client.player_name is not None
+
+    def has_update(self, client):
+        return client.has_update is True
+
+    def reset_has_update(self):
+        for client in self.clients:
+            client.has_update = False
+        self._clients_having_update.clear()
+
+    def add_client_awaiting_tes3mp_ip(self, client):
+        self._clients_awaiting_tes3mp_ip.add(client)
+
+    # Update player data for client iif they differ from last obtained, told apart by their versions
+    def update_allies_data(self, client, new_data, version: int):
+        if version == client.allies_data_version:
+            return
+
+        self.logger.append("Updated " + client.player_name + "'s allies data", key="allies_data_updated")
+        client.allies_data = new_data
+        client.allies_data_version = version
+        client.has_update = True
+        self._clients_having_update.add(client)
+
+    # Update tes3mp ip of clients who are awaiting it
+    # Also validate client"s ips to filter out those trying to impersonate other players
+    # Clients are routed to the source having a player of their name with their ip
+    def update_clients_awaiting_tes3mp_ip(self):
+        clients = self.get_clients_awaiting_tes3mp_ip()
+        for client in clients:
+            if client.player_name is not None:
+                candidates = []
+                for source in self.sources:
+                    tes3mp_ip = source.json_loader.get_tes3mp_ip_by_name(client.player_name)
+                    if tes3mp_ip:
+                        candidates.append((source, tes3mp_ip))
+
+                if candidates:
+                    matching = [candidate for candidate in candidates if candidate[1] == client.ip]
+                    client.source, client.tes3mp_ip = matching[0] if matching else candidates[0]
+                    # Disable client awaiting tes3mp ip
+                    client.awaiting_tes3mp_ip = False
+                    self._clients_awaiting_tes3mp_ip.discard(client)
+                    # Validate client's ips
+                    self.validate_client(client)
+
+    # Update clients" allies data if the data is new
+    # Only clients allied with players whose stats have changed and newly verified clients are touched
+    # Allies data still waiting to be sent to a throttled client is replaced with the newer one
+    def update_clients_allies_data(self):
+        clients = set(self._clients_awaiting_allies_data)
+        self._clients_awaiting_allies_data.clear()
+
+        for source in self.sources:
+            for player_name in source.get_changed_players():
+                clients.update(source.get_clients(player_name))
+
+        for client in clients:
+            json_loader = client.source.json_loader
+            new_data = json_loader.get_player_data_by_name(client.player_name)
+            if new_data:
+                self.update_allies_data(client, new_data["alliesData"],
+                                        json_loader.get_player_version(client.player_name))
+
+    # Send data to clients having update, throttled clients keep their update until they are ready
+    def update_clients_having_update(self):
+        clients = self.get_clients_having_update()
+        now = time.monotonic()
+        for client in clients:
+            if not self.ready_to_send(client, now):
+                continue
+            self.logger.append("Sending allies data to " + client.player_name, key="allies_data_sent")
+
+            # Failing to send to one client must not keep allies data from the others
+            # Versions are restored so the allies are sent again with the next update
+            sent_ally_versions = client.sent_ally_versions
+            try:
+                self.Send_allies_data(client)
+            except Exception as e:
+                client.sent_ally_versions = sent_ally_versions
+                self._clients_having_update.discard(client)
+                self.logger.append("Sending allies data to " + client.player_name + " failed: " + repr(e), ERROR,
+                                   "send_allies_data_error")
+            # Reset has_update flag for the client
+            client.has_update = False
+
+
+    # Run verification and fan-out passes
+    def update_clients(self):
+        # Update and validate tes3mp ip addresses for clients
+        with self.metrics.timer("update_clients_awaiting_tes3mp_ip"):
+            self.update_clients_awaiting_tes3mp_ip()
+
+        # Update clients with allies data if there is any for them
+        with self.metrics.timer("update_clients_allies_data"):
+            self.update_clients_allies_data()
+
+        # If the clients have received new data their has_update flags will be turned on
+        # Issue an update for these clients
+        with self.metrics.timer("update_clients_having_update"):
+            self.update_clients_having_update()
+
+    # Get clients waiting for tes3mp ip in order to check for impersonation
+    def get_clients_awaiting_tes3mp_ip(self):
+        return list(self._clients_awaiting_tes3mp_ip)
+
+    # Get clients awaiting new data
+    def get_clients_without_update(self):
+        return [client for source in self.sources for client in source.get_verified_clients()
+                if not client.has_update]
+
+    def get_clients_having_update(self):
+        return list(self._clients_having_update)
+
+    def validate_client(self, client):
+        if client.ip != client.tes3mp_ip:
+            client.Kick("Tried impersonating another player.")
+            return
+        self.logger.append("Player " + client.player_name + " of " + client.source.name +
+                           " has been successfully verified")
+
+        client.source.add_client(client)
+        self._clients_awaiting_allies_data.add(client)
@@ -0,0 +1,93 @@
+import select
+import threading
+
+from file_watcher import create_file_watcher_from_config
+from json_loader import JsonLoader
+from logger import Logger, ERROR
+from metrics import Metrics
+from wakeup import Wakeup
+
+"""Reads, validates and compares snapshots of one source on a background thread
+The server loop only swaps in the snapshot built by the reader, so big snapshots never delay sends"""
+
+
+class SnapshotReader:
+
+    # Players' data is expected to have been loaded once already, the reader only follows changes
+    def __init__(self, watcher, json_loader: JsonLoader, logger: Logger, metrics: Metrics):
+        self._watcher = watcher
+        self._json_loader = json_loader
+        self._logger = logger
+        self._metrics = metrics
+
+        # Snapshot built by the reader and not yet taken by the server loop
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+        # Wakes the server loop up once a snapshot has been built
+        self._wakeup = Wakeup()
+
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._read_snapshots, name="snapshot-reader-" + json_loader.name,
+                                        daemon=True)
+        self._thread.start()
+
+    def fileno(self):
+        return self._wakeup.fileno()
+
+    # Return the snapshot built since the last call or None
+    def consume(self):
+        self._wakeup.drain()
+
+        with self._lock:
+            snapshot = self._snapshot
+            self._snapshot = None
+        return snapshot
+
+    def close(self):
+        self._closed.set()
+        self._thread.join()
+        self._watcher.close()
+        self._wakeup.close()
+
+    def _read_snapshots(self):
+        # Every source has its own reader thread and so its own phase
+        timer = self._metrics.timer("read_snapshot_" + self._json_loader.name)
+
+        while not self._closed.is_set():
+            readable, _, _ = select.select([self._watcher.fileno()], [], [], 1.0)
+            if not readable or not self._watcher.consume():
+                continue
+
+            try:
+                with timer:
+                    snapshot = self._json_loader.read_snapshot()
+            except Exception as e:
+                self._logger.append("Reading snapshot of source " + self._json_loader.name + " failed: " + repr(e),
+                                    ERROR, "snapshot_reader_error")
+                continue
+
+            if snapshot is None:
+                continue
+
+            # A snapshot the server loop has not taken yet is replaced, its changes are carried over
+            with self._lock:
+                if self._snapshot is not None:
+                    snapshot = self._snapshot.merge_changes(snapshot)
+                self._snapshot = snapshot
+            self._wakeup.notify()
+
+    @property
+    def json_loader(self):
+        return self._json_loader
+
+
+# Load players' data of every source read from a file and start following its changes on a background thread
+def create_snapshot_readers(config: dict, sources: list, logger: Logger, metrics: Metrics):
+    readers = []
+    for source in sources:
+        # Watch first so that changes made while loading are not missed
+        watcher = create_file_watcher_from_config(config, logger, source.json_loader.file_path)
+        source.json_loader.load_initial_player_data()
+        readers.append(SnapshotReader(watcher, source.json_loader, logger, metrics))
+    return readers
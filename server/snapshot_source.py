@@ -0,0 +1,73 @@
+from encoded_allies import EncodedAllies
+from json_loader import JsonLoader
+from logger import Logger
+
+"""Snapshot sources of one server, every source is a TES3MP server with players of its own
+Player names are namespaced by source, the same name on two sources are two different players"""
+
+
+class SnapshotSource:
+
+    def __init__(self, json_loader: JsonLoader):
+        self._json_loader = json_loader
+
+        # Player name -> clients verified as that player of this source
+        # A player may run more than one client, all of them are sent allies data
+        self._clients_by_name = dict()
+        # Count of the clients above kept by the server loop, stats threads read it instead of the dictionary
+        self._verified_clients_count = 0
+
+        # Allies' stats encoded for messages of this source's clients
+        self._encoded_allies = EncodedAllies()
+
+    # Get names of players whose allies data has changed since the last call
+    # They are found when the snapshots are built, see JsonLoader.build_snapshot
+    # Encodings of allies gone from a new snapshot are dropped meanwhile
+    def get_changed_players(self):
+        self._encoded_allies.prune(self._json_loader.generation, self._json_loader.get_ally_names())
+        return self._json_loader.take_changed_players()
+
+    def add_client(self, client):
+        clients = self._clients_by_name.setdefault(client.player_name, [])
+        if client not in clients:
+            clients.append(client)
+            self._verified_clients_count += 1
+
+    def remove_client(self, client):
+        clients = self._clients_by_name.get(client.player_name)
+        if clients is not None and client in clients:
+            clients.remove(client)
+            self._verified_clients_count -= 1
+            if not clients:
+                del self._clients_by_name[client.player_name]
+
+    # Get clients verified as the player
+    def get_clients(self, player_name: str):
+        return self._clients_by_name.get(player_name, ())
+
+    def get_verified_clients(self):
+        return [client for clients in self._clients_by_name.values() for client in clients]
+
+    # Safe to call from other threads than the server loop, see metrics.py
+    def get_verified_clients_count(self):
+        return self._verified_clients_count
+
+    @property
+    def name(self):
+        return self._json_loader.name
+
+    @property
+    def json_loader(self):
+        return self._json_loader
+
+    @property
+    def encoded_allies(self):
+        return self._encoded_allies
+
+
+# Create a source for every entry of "sources" in server config, the first one uses the given loader
+def create_snapshot_sources(logger: Logger, json_loader: JsonLoader):
+    sources = [SnapshotSource(json_loader)]
+    for source in json_loader.get_sources_config()[1:]:
+        sources.append(SnapshotSource(JsonLoader(logger, json_loader.config, source)))
+    return sources
@@ -0,0 +1,158 @@
+import argparse
+import json
+import os
+import random
+import socket
+import time
+
+"""Stand-in for alliesHealthBars.lua producing players' data without a TES3MP server
+
+Writes the same structure the Lua script saves into alliesHealthBars.json, either into a file
+or as newline-delimited records pushed to the server's ingest socket, see ingest_server.py
+Example: python stand_in_producer.py --players 8 --party-size 4 --socket 127.0.0.1:8001"""
+
+
+class StandInProducer:
+
+    # alliance_graph is either "parties" or "random"
+    def __init__(self, players_count: int, party_size: int, ip: str = "127.0.0.1", seed: int = None,
+                 alliance_graph: str = "parties", source: str = None):
+        self._random = random.Random(seed)
+        self._player_names = ["Player " + str(i) for i in range(players_count)]
+        self._ip = ip
+
+        if alliance_graph == "random":
+            self._allies_by_player = self._create_random_alliances(party_size - 1)
+        else:
+            self._allies_by_player = self._create_parties(party_size)
+
+        self._stats_by_player = {player_name: self._create_stats() for player_name in self._player_names}
+
+        # Snapshots are stamped like the Lua script does, see json_loader.py
+        self._session = int(time.time())
+        self._sequence = 0
+
+        # Name of the source in server config the records are pushed for, see ingest_server.py
+        self._source = source
+
+    # Split players into parties, every member of a party is allied with all other members
+    def _create_parties(self, party_size: int):
+        allies_by_player = dict()
+        for start in range(0, len(self._player_names), party_size):
+            party = self._player_names[start:start + party_size]
+            for player_name in party:
+                allies_by_player[player_name] = [name for name in party if name != player_name]
+        return allies_by_player
+
+    # Ally every player with about allies_count random players, alliances are mutual so parties overlap
+    def _create_random_alliances(self, allies_count: int):
+        allies_by_player = {player_name: set() for player_name in self._player_names}
+        for player_name in self._player_names:
+            candidates = [name for name in self._player_names if name != player_name]
+            for ally_name in self._random.sample(candidates, min(allies_count, len(candidates))):
+                allies_by_player[player_name].add(ally_name)
+                allies_by_player[ally_name].add(player_name)
+        return {player_name: sorted(allies) for player_name, allies in allies_by_player.items()}
+
+    def _create_stats(self):
+        base_health = float(self._random.randint(50, 400))
+        base_magicka = float(self._random.randint(50, 400))
+        base_fatigue = float(self._random.randint(50, 400))
+        return {"level": self._random.randint(1, 60),
+                "baseHealth": base_health, "currentHealth": base_health,
+                "baseMagicka": base_magicka, "currentMagicka": base_magicka,
+                "baseFatigue": base_fatigue, "currentFatigue": base_fatigue}
+
+    # Change current stats of a portion of players, as players fighting or running would
+    def tick(self, churn: float = 0.25):
+        for player_name in self._player_names:
+            if self._random.random() >= churn:
+                continue
+
+            stats = self._stats_by_player[player_name]
+            for stat in ("Health", "Magicka", "Fatigue"):
+                base = stats["base" + stat]
+                current = stats["current" + stat] + self._random.uniform(-0.2, 0.1) * base
+                stats["current" + stat] = round(min(max(current, 0.0), base), 2)
+
+    # Get players' data in the structure written by alliesHealthBars.lua
+    def get_players_data(self):
+        players_data = dict()
+        for player_name in self._player_names:
+            allies_data = {ally_name: dict(self._stats_by_player[ally_name])
+                           for ally_name in self._allies_by_player[player_name]}
+            players_data[player_name] = {"ip": self._ip, "alliesData": allies_data}
+        return players_data
+
+    # Write stamped snapshot into a temporary file and rename it in place of the previous one
+    def write_file(self, file_path: str):
+        self._sequence += 1
+        temp_file_path = file_path + ".tmp"
+        with open(temp_file_path, "w") as data:
+            data.write('{"sequence":' + str(self._sequence) + ',"session":' + str(self._session) +
+                       ',"timestamp":' + str(int(time.time())) + ',"players":' +
+                       json.dumps(self.get_players_data()) + '}')
+        os.replace(temp_file_path, file_path)
+
+    # Send players' data as ingest records followed by a stamped commit record
+    def send_records(self, connection: socket.socket):
+        self._sequence += 1
+        lines = []
+        for player_name, player_data in self.get_players_data().items():
+            lines.append(json.dumps({"type": "player", "name": player_name, "ip": player_data["ip"],
+                                     "alliesData": player_data["alliesData"]}))
+        commit = {"type": "commit", "session": self._session, "sequence": self._sequence, "timestamp": time.time()}
+        if self._source is not None:
+            commit["source"] = self._source
+        lines.append(json.dumps(commit))
+        connection.sendall(("\n".join(lines) + "\n").encode("utf-8"))
+
+
+def connect(args):
+    if args.unix:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(args.unix)
+        return connection
+
+    host, port = args.socket.rsplit(":", 1)
+    return socket.create_connection((host, int(port)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Produce players' data the way alliesHealthBars.lua does")
+    parser.add_argument("--players", type=int, default=8, help="number of logged in players")
+    parser.add_argument("--party-size", type=int, default=4, help="number of players allied together")
+    parser.add_argument("--alliance-graph", choices=("parties", "random"), default="parties",
+                        help="disjoint parties or overlapping random alliances of about party size")
+    parser.add_argument("--interval", type=float, default=0.01, help="seconds between two ticks")
+    parser.add_argument("--ticks", type=int, default=0, help="number of ticks to produce, 0 runs forever")
+    parser.add_argument("--churn", type=float, default=0.25, help="portion of players changing stats every tick")
+    parser.add_argument("--ip", default="127.0.0.1", help="ip address reported for every player")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--source", help="name of the source in server config the socket records are pushed for")
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument("--file", help="path of the .json file to write")
+    output.add_argument("--socket", help="host:port of the server's ingest socket")
+    output.add_argument("--unix", help="path of the server's ingest unix socket")
+    args = parser.parse_args()
+
+    producer = StandInProducer(args.players, args.party_size, args.ip, args.seed, args.alliance_graph, args.source)
+    connection = None if args.file else connect(args)
+
+    tick = 0
+    while args.ticks == 0 or tick < args.ticks:
+        if connection is None:
+            producer.write_file(args.file)
+        else:
+            producer.send_records(connection)
+
+        producer.tick(args.churn)
+        tick += 1
+        time.sleep(args.interval)
+
+    if connection is not None:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import base64
+import math
+import struct
+
+"""Compact in-memory and binary representation of allies stats, the same module is shipped with the client"""
+
+# Order of stats within a packed record
+STAT_FIELDS = ("level", "baseHealth", "currentHealth", "baseMagicka", "currentMagicka", "baseFatigue",
+               "currentFatigue")
+
+# Ally id, level and six stat values
+STATS_RECORD = struct.Struct("<IH6f")
+
+# Wire formats in order of preference
+WIRE_FORMATS = ("binary", "dict")
+
+
+# Check stats values in STAT_FIELDS order fit a record, level is an integer within the record's range
+# and the rest are finite numbers, booleans are numbers to Python but not stats
+def is_valid_stats(values: tuple):
+    level = values[0]
+    if type(level) is not int or not 0 <= level <= 0xFFFF:
+        return False
+
+    for value in values[1:]:
+        if type(value) not in (int, float) or not math.isfinite(value):
+            return False
+
+    try:
+        STATS_RECORD.pack(0, *values)
+    except (struct.error, OverflowError):
+        return False
+    return True
+
+
+# Stats of one ally, slotted so a record costs a fraction of a dict with seven string keys
+# Records are not modified once created, servers share one record among all players having the ally
+# Servers give every distinct record a version of its own, see json_loader.JsonLoader
+class AllyStats:
+    __slots__ = ("level", "base_health", "current_health", "base_magicka", "current_magicka", "base_fatigue",
+                 "current_fatigue", "version")
+
+    def __init__(self, level, base_health, current_health, base_magicka, current_magicka, base_fatigue,
+                 current_fatigue, version=None):
+        self.level = level
+        self.base_health = base_health
+        self.current_health = current_health
+        self.base_magicka = base_magicka
+        self.current_magicka = current_magicka
+        self.base_fatigue = base_fatigue
+        self.current_fatigue = current_fatigue
+        self.version = version
+
+    # Create record from stats dict with STAT_FIELDS keys, as written by the Lua script
+    @classmethod
+    def from_dict(cls, stats: dict):
+        return cls(stats["level"], stats["baseHealth"], stats["currentHealth"], stats["baseMagicka"],
+                   stats["currentMagicka"], stats["baseFatigue"], stats["currentFatigue"])
+
+    def as_tuple(self):
+        return (self.level, self.base_health, self.current_health, self.base_magicka, self.current_magicka,
+                self.base_fatigue, self.current_fatigue)
+
+    # Get stats dict with STAT_FIELDS keys, the dict wire format sends these
+    def to_dict(self):
+        return dict(zip(STAT_FIELDS, self.as_tuple()))
+
+    # Get STAT_FIELDS keyed dict of the fields differing from the old record
+    def get_changed_fields(self, old):
+        return {field: value for field, value, old_value in zip(STAT_FIELDS, self.as_tuple(), old.as_tuple())
+                if value != old_value}
+
+    # Get new record with fields of a STAT_FIELDS keyed dict applied, as received in an allies delta
+    def updated(self, changed_fields: dict):
+        stats = self.to_dict()
+        stats.update(changed_fields)
+        return AllyStats.from_dict(stats)
+
+    def __eq__(self, other):
+        return isinstance(other, AllyStats) and self.as_tuple() == other.as_tuple()
+
+    def __repr__(self):
+        return "AllyStats" + repr(self.as_tuple())
+
+
+# Pack AllyStats of one ally into a base64 encoded fixed-width record
+# Records are 30 bytes, a multiple of 3, so base64 of several records is the concatenation of their base64
+# Records are base64 encoded as PodSixNet's rencode decodes every string it receives as UTF-8
+def pack_ally(ally_id: int, stats: AllyStats):
+    record = STATS_RECORD.pack(ally_id, int(stats.level), stats.base_health, stats.current_health,
+                               stats.base_magicka, stats.current_magicka, stats.base_fatigue, stats.current_fatigue)
+    return base64.b64encode(record).decode("ascii")
+
+
+# Pack AllyStats of the allies into records, ally_ids maps ally name to its id
+def pack_allies(ally_ids: dict, allies_data: dict):
+    return "".join(pack_ally(ally_ids[ally_name], stats) for ally_name, stats in allies_data.items())
+
+
+# Unpack records into a dict of ally id -> AllyStats
+def unpack_allies(payload: str):
+    allies_data = dict()
+    for record in STATS_RECORD.iter_unpack(base64.b64decode(payload)):
+        allies_data[record[0]] = AllyStats(*record[1:])
+    return allies_data
+
+
+# Pick the most preferred wire format supported by both sides
+def negotiate_wire_format(client_formats):
+    for wire_format in WIRE_FORMATS:
+        if wire_format in client_formats:
+            return wire_format
+    return "dict"
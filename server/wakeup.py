@@ -0,0 +1,32 @@
+import socket
+
+"""Wakeup file descriptor background threads use to wake the server loop up, see server_app.py and async_server.py"""
+
+
+class Wakeup:
+
+    def __init__(self):
+        # Socket pair instead of a pipe so the wakeup fd can be selected on Windows as well
+        self._reader, self._writer = socket.socketpair()
+        self._reader.setblocking(False)
+
+    def fileno(self):
+        return self._reader.fileno()
+
+    # Called from background threads
+    def notify(self):
+        self._writer.send(b"\0")
+
+    # Take pending notifications, return True if there were any since the last call
+    def drain(self):
+        notified = False
+        try:
+            while self._reader.recv(4096):
+                notified = True
+        except BlockingIOError:
+            pass
+        return notified
+
+    def close(self):
+        self._reader.close()
+        self._writer.close()